@@ -1,7 +1,8 @@
 """Chat/Doubt Agent - Answers questions about study material"""
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 from datetime import datetime
-from utils.llm_utils import call_llm
+import numpy as np
+from utils.llm_utils import call_llm, stream_llm
 from utils.prompts import CHAT_PROMPT
 from utils.memory import MemoryModule
 from utils.database import StudyDatabase
@@ -11,10 +12,16 @@ import config
 class ChatAgent:
     """Agent responsible for answering questions about study material"""
     
-    def __init__(self):
+    def __init__(self, memory: Optional[MemoryModule] = None, db: Optional[StudyDatabase] = None):
+        """
+        Args:
+            memory: Memory module to reuse (loads a new one, with its own embedding model, if omitted)
+            db: Database handle to reuse (opens one, checking the schema, if omitted)
+        """
         self.conversation_history = []
-        self.memory = MemoryModule()
-        self.db = StudyDatabase()
+        self.last_confidence = "medium"  # confidence of the last streamed answer
+        self.memory = memory if memory is not None else MemoryModule()
+        self.db = db if db is not None else StudyDatabase()
     
     def answer_question(self, question: str, context: str, file_id: Optional[int] = None, max_context_length: int = 3000) -> Dict:
         """
@@ -73,25 +80,98 @@ class ChatAgent:
                 "confidence": "low"
             }
     
-    def find_relevant_context(self, question: str, chunks: List[str]) -> str:
+    def answer_question_stream(self, question: str, context: str, file_id: Optional[int] = None,
+                               max_context_length: int = 3000) -> Iterator[str]:
         """
-        Find the most relevant context chunks for a question using FAISS semantic search.
+        Answer a student's question, yielding the answer text as it is generated.
+        
+        Like answer_question, the finished answer is added to the conversation
+        history (and database); its confidence is left in last_confidence.
+        
+        Args:
+            question: Student's question
+            context: Relevant study material context
+            file_id: Database file ID to save the exchange under (optional)
+            max_context_length: Maximum length of context to use
+            
+        Returns:
+            Iterator over pieces of the answer text
+        """
+        # Truncate context if too long
+        if len(context) > max_context_length:
+            context = context[:max_context_length] + "..."
+        
+        prompt = CHAT_PROMPT.format(
+            context=context,
+            question=question
+        )
+        
+        pieces = []
+        try:
+            # Chat agent uses ONLY Gemini
+            if not config.GEMINI_API_KEY:
+                raise ValueError("GEMINI_API_KEY not set. Please set it in .env file or Streamlit Cloud Secrets")
+            
+            for piece in stream_llm(prompt, provider="gemini"):
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            self.last_confidence = "low"
+            yield f"I encountered an error while processing your question: {str(e)}. Please try rephrasing your question."
+            return
+        
+        answer = "".join(pieces)
+        self.last_confidence = "high" if len(context) > 500 else "medium"
+        
+        # Store in conversation history
+        self.conversation_history.append({
+            "question": question,
+            "answer": answer,
+            "timestamp": str(datetime.now())
+        })
+        
+        # Save to database if file_id provided
+        if file_id:
+            self.db.save_chat_message(file_id, question, answer, self.last_confidence)
+    
+    def find_relevant_context(self, question: str, chunks: List[str],
+                              index: Optional[np.ndarray] = None) -> str:
+        """
+        Find the most relevant context chunks for a question using semantic search.
         
         Args:
             question: Student's question
             chunks: List of text chunks
+            index: Embeddings of chunks from MemoryModule.embed_chunks (searches the FAISS memory if omitted)
             
         Returns:
             Most relevant context string
         """
-        # Use FAISS memory module for semantic search
+        # Use the document's chunk embeddings, or the FAISS memory module, for semantic search
         try:
-            relevant_chunks = self.memory.find_relevant_chunks(question, chunks, k=3)
+            if index is not None:
+                relevant_chunks = self.memory.top_chunks(question, chunks, index, k=3)
+            else:
+                relevant_chunks = self.memory.find_relevant_chunks(question, chunks, k=3)
             if relevant_chunks:
                 return "\n\n".join(relevant_chunks)
         except Exception as e:
             print(f"Error in semantic search, falling back to keyword matching: {e}")
         
+        return self.keyword_context(question, chunks)
+    
+    @staticmethod
+    def keyword_context(question: str, chunks: List[str]) -> str:
+        """
+        Find context for a question by keyword overlap (the fallback when semantic search fails).
+        
+        Args:
+            question: Student's question
+            chunks: List of text chunks
+            
+        Returns:
+            Top matching chunks, or the first two chunks if none match
+        """
         # Fallback: Simple keyword matching
         question_lower = question.lower()
         question_words = set(question_lower.split())
@@ -1,13 +1,23 @@
 """Flashcard Agent - Generates Q/A flashcards from study material"""
-from typing import List, Dict, Optional
+import asyncio
+import re
+from typing import Callable, List, Dict, Optional
 from utils.llm_utils import call_llm, parse_json_response
-from utils.prompts import FLASHCARD_PROMPT
+from utils.prompts import build_flashcard_prompt
 from utils.database import StudyDatabase
 import config
 import json
 import os
 
 
+# Fallbacks for pulling flashcards out of a response that is not clean JSON
+_JSON_ARRAY_RE = re.compile(r'\[[\s\S]*?\]')
+# An object (allowing one level of nested braces) containing "question" then "answer"
+_FLASHCARD_OBJECT_RE = re.compile(
+    r'\{(?:[^{}]|(?:\{[^{}]*\}))*"question"(?:[^{}]|(?:\{[^{}]*\}))*"answer"(?:[^{}]|(?:\{[^{}]*\}))*\}'
+)
+
+
 class FlashcardAgent:
     """Agent responsible for generating flashcards"""
     
@@ -46,10 +56,7 @@ class FlashcardAgent:
         text_to_use = text[:4000]  # Limit to avoid token limits
         print(f"Text being used (first 4000 chars): {len(text_to_use)} characters")
         
-        prompt = FLASHCARD_PROMPT.format(
-            text=text_to_use,
-            num_flashcards=num_flashcards
-        )
+        prompt = build_flashcard_prompt(text_to_use, num_flashcards)
         
         # Add instruction for short sticky-note style
         prompt += "\n\nIMPORTANT: Keep answers SHORT (1-2 sentences max). Think sticky notes, not essays! Focus on key points only."
@@ -103,10 +110,7 @@ class FlashcardAgent:
                 print(f"⚠️ Current flashcards value: {flashcards}")
                 
                 # Try to find array in response text
-                import re
-                
-                # First, try to find a JSON array
-                json_match = re.search(r'\[[\s\S]*?\]', response, re.DOTALL)
+                json_match = _JSON_ARRAY_RE.search(response)
                 if json_match:
                     try:
                         extracted = json.loads(json_match.group())
@@ -121,8 +125,7 @@ class FlashcardAgent:
                 if not isinstance(flashcards, list):
                     try:
                         # Look for objects with question/answer
-                        obj_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*"question"(?:[^{}]|(?:\{[^{}]*\}))*"answer"(?:[^{}]|(?:\{[^{}]*\}))*\}'
-                        obj_matches = re.findall(obj_pattern, response, re.DOTALL)
+                        obj_matches = _FLASHCARD_OBJECT_RE.findall(response)
                         if obj_matches:
                             flashcards = []
                             for match in obj_matches:
@@ -167,19 +170,71 @@ class FlashcardAgent:
             # Re-raise with more context
             raise Exception(f"Failed to generate flashcards: {error_msg}")
     
-    def generate_from_chunks(self, chunks: List[str], max_chunks: int = 5) -> List[Dict]:
+    def generate_from_chunks(self, chunks: List[str], max_chunks: int = 5,
+                             streaming_callback: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
         """
         Generate flashcards from multiple text chunks.
         
         Args:
             chunks: List of text chunks
             max_chunks: Maximum number of chunks to process (to avoid timeouts)
+            streaming_callback: Called with each chunk's flashcards as soon as they are ready
             
         Returns:
             Combined list of flashcards
         """
-        all_flashcards = []
+        chunks_to_process = self._select_chunks(chunks, max_chunks)
+        results = []
+        for i, chunk in enumerate(chunks_to_process):
+            flashcards = self._flashcards_for_chunk(i, chunk, len(chunks_to_process))
+            if flashcards and streaming_callback:
+                streaming_callback(flashcards)
+            results.append(flashcards)
+        return self._combine(results, len(chunks_to_process))
+    
+    async def generate_from_chunks_async(self, chunks: List[str], max_chunks: int = 5,
+                                         concurrency: int = 5,
+                                         streaming_callback: Optional[Callable[[List[Dict]], None]] = None) -> List[Dict]:
+        """
+        Generate flashcards from multiple text chunks, with one LLM request per chunk in flight at once.
+        
+        Same results as generate_from_chunks, but total time tracks the slowest
+        chunk rather than the sum of all of them.
+        
+        Args:
+            chunks: List of text chunks
+            max_chunks: Maximum number of chunks to process (to avoid timeouts)
+            concurrency: Maximum number of chunks processed at the same time
+            streaming_callback: Called with each chunk's flashcards as soon as they are
+                ready, in completion order
+            
+        Returns:
+            Combined list of flashcards, in chunk order
+        """
+        chunks_to_process = self._select_chunks(chunks, max_chunks)
+        semaphore = asyncio.Semaphore(concurrency)
         
+        async def _one(i: int, chunk: str) -> List[Dict]:
+            async with semaphore:
+                flashcards = await asyncio.to_thread(
+                    self._flashcards_for_chunk, i, chunk, len(chunks_to_process)
+                )
+            if flashcards and streaming_callback:
+                streaming_callback(flashcards)
+            return flashcards
+        
+        # A failed chunk contributes no cards instead of failing the others
+        results = await asyncio.gather(
+            *(_one(i, chunk) for i, chunk in enumerate(chunks_to_process)), return_exceptions=True
+        )
+        for i, result in enumerate(results):
+            if isinstance(result, BaseException):
+                print(f"Error processing chunk {i}: {result}")
+        return self._combine([r for r in results if not isinstance(r, BaseException)], len(chunks_to_process))
+    
+    @staticmethod
+    def _select_chunks(chunks: List[str], max_chunks: int) -> List[str]:
+        """Keep the first max_chunks chunks that are long enough to generate flashcards from"""
         if not chunks:
             raise ValueError("No chunks provided for flashcard generation")
         
@@ -190,66 +245,81 @@ class FlashcardAgent:
             raise ValueError("No valid chunks found. Chunks must be at least 100 characters long.")
         
         # Limit chunks to avoid timeout
-        chunks_to_process = valid_chunks[:max_chunks]
+        return valid_chunks[:max_chunks]
+    
+    @staticmethod
+    def _combine(results: List[List[Dict]], num_chunks: int) -> List[Dict]:
+        """Flatten per-chunk flashcards, failing if none were generated"""
+        all_flashcards = [card for flashcards in results for card in flashcards]
         
-        for i, chunk in enumerate(chunks_to_process):
+        if not all_flashcards:
+            raise ValueError(f"Failed to generate flashcards from {num_chunks} chunks. The content might be too short or the API returned invalid responses.")
+        
+        return all_flashcards
+    
+    def _flashcards_for_chunk(self, i: int, chunk: str, num_chunks: int) -> List[Dict]:
+        """
+        Generate flashcards for one chunk, retrying with fewer cards on failure.
+        
+        Args:
+            i: Chunk index (stored as each card's chunk_id)
+            chunk: Chunk text
+            num_chunks: Number of chunks being processed (for progress output)
+            
+        Returns:
+            Flashcards for this chunk (empty if every attempt failed)
+        """
+        try:
+            # Ensure chunk has enough content
+            if len(chunk.strip()) < 100:
+                print(f"Skipping chunk {i}: too short ({len(chunk.strip())} chars)")
+                return []
+            
+            # Debug: Print chunk info
+            print(f"Processing chunk {i+1}/{num_chunks}: {len(chunk)} characters")
+            print(f"Chunk preview: {chunk[:100]}...")
+            
             try:
-                # Ensure chunk has enough content
-                if len(chunk.strip()) < 100:
-                    print(f"Skipping chunk {i}: too short ({len(chunk.strip())} chars)")
-                    continue
+                flashcards = self.generate_flashcards(chunk, num_flashcards=3)
                 
-                # Debug: Print chunk info
-                print(f"Processing chunk {i+1}/{len(chunks_to_process)}: {len(chunk)} characters")
-                print(f"Chunk preview: {chunk[:100]}...")
+                if flashcards and len(flashcards) > 0:
+                    print(f"✅ Generated {len(flashcards)} flashcards from chunk {i+1}")
+                    for card in flashcards:
+                        card['chunk_id'] = i
+                    return flashcards
                 
+                print(f"⚠️ No flashcards from chunk {i+1}, trying with fewer cards...")
+                # Try with a simpler prompt if first attempt failed
                 try:
-                    flashcards = self.generate_flashcards(chunk, num_flashcards=3)
-                    
+                    flashcards = self.generate_flashcards(chunk, num_flashcards=2)
                     if flashcards and len(flashcards) > 0:
-                        print(f"✅ Generated {len(flashcards)} flashcards from chunk {i+1}")
+                        print(f"✅ Generated {len(flashcards)} flashcards from chunk {i+1} (retry)")
                         for card in flashcards:
                             card['chunk_id'] = i
-                        all_flashcards.extend(flashcards)
-                    else:
-                        print(f"⚠️ No flashcards from chunk {i+1}, trying with fewer cards...")
-                        # Try with a simpler prompt if first attempt failed
-                        try:
-                            flashcards = self.generate_flashcards(chunk, num_flashcards=2)
-                            if flashcards and len(flashcards) > 0:
-                                print(f"✅ Generated {len(flashcards)} flashcards from chunk {i+1} (retry)")
-                                for card in flashcards:
-                                    card['chunk_id'] = i
-                                all_flashcards.extend(flashcards)
-                            else:
-                                print(f"❌ Still no flashcards from chunk {i+1} after retry")
-                        except Exception as retry_error:
-                            print(f"Retry failed for chunk {i+1}: {str(retry_error)}")
-                except Exception as gen_error:
-                    print(f"❌ Error generating flashcards from chunk {i+1}: {str(gen_error)}")
-                    # Try one more time with a very simple request
-                    try:
-                        flashcards = self.generate_flashcards(chunk, num_flashcards=1)
-                        if flashcards and len(flashcards) > 0:
-                            print(f"✅ Generated {len(flashcards)} flashcard from chunk {i+1} (final retry)")
-                            for card in flashcards:
-                                card['chunk_id'] = i
-                            all_flashcards.extend(flashcards)
-                    except:
-                        pass
-                        
-            except Exception as e:
-                error_msg = str(e)
-                # Don't silently fail - log the error
-                import sys
-                print(f"Error processing chunk {i}: {error_msg}", file=sys.stderr)
-                # Continue with next chunk
-                continue
-        
-        if not all_flashcards:
-            raise ValueError(f"Failed to generate flashcards from {len(chunks_to_process)} chunks. The content might be too short or the API returned invalid responses.")
+                        return flashcards
+                    print(f"❌ Still no flashcards from chunk {i+1} after retry")
+                except Exception as retry_error:
+                    print(f"Retry failed for chunk {i+1}: {str(retry_error)}")
+            except Exception as gen_error:
+                print(f"❌ Error generating flashcards from chunk {i+1}: {str(gen_error)}")
+                # Try one more time with a very simple request
+                try:
+                    flashcards = self.generate_flashcards(chunk, num_flashcards=1)
+                    if flashcards and len(flashcards) > 0:
+                        print(f"✅ Generated {len(flashcards)} flashcard from chunk {i+1} (final retry)")
+                        for card in flashcards:
+                            card['chunk_id'] = i
+                        return flashcards
+                except:
+                    pass
+                    
+        except Exception as e:
+            error_msg = str(e)
+            # Don't silently fail - log the error
+            import sys
+            print(f"Error processing chunk {i}: {error_msg}", file=sys.stderr)
         
-        return all_flashcards
+        return []
     
     def save_flashcards(self, flashcards: List[Dict], file_id: Optional[int] = None, filename: str = "flashcards.json"):
         """
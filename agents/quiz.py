@@ -1,5 +1,8 @@
 """Quiz Agent - Generates multiple-choice quizzes from study material"""
-from typing import List, Dict, Optional
+import itertools
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, Dict, Optional
 from utils.llm_utils import call_llm, parse_json_response
 from utils.prompts import QUIZ_PROMPT
 from utils.database import StudyDatabase
@@ -8,6 +11,10 @@ import json
 import os
 
 
+# Fallback for pulling the question array out of a response that is not clean JSON
+_JSON_ARRAY_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+
 class QuizAgent:
     """Agent responsible for generating quizzes"""
     
@@ -68,8 +75,7 @@ class QuizAgent:
             # If still not a list, try to extract from response
             if not isinstance(questions, list):
                 # Try to find array in response text
-                import re
-                json_match = re.search(r'\[.*\]', response, re.DOTALL)
+                json_match = _JSON_ARRAY_RE.search(response)
                 if json_match:
                     try:
                         questions = json.loads(json_match.group())
@@ -132,8 +138,58 @@ class QuizAgent:
         Returns:
             Combined list of quiz questions
         """
-        all_questions = []
+        chunks_to_process = self._select_chunks(chunks, max_chunks)
+        results = [self._questions_for_chunk(i, chunk, difficulty)
+                   for i, chunk in enumerate(chunks_to_process)]
+        return self._combine(results, len(chunks_to_process))
+    
+    def generate_from_chunks_iter(self, chunks: List[str], difficulty: str = "Medium",
+                                  max_chunks: int = 3, concurrency: int = 2) -> Iterator[Dict]:
+        """
+        Generate quiz questions from multiple text chunks, yielding each chunk's questions as soon as they are ready.
+        
+        Up to concurrency chunks are in flight at once, and the next chunk is only
+        sent once the caller asks for more questions than have arrived, so taking
+        only the questions needed saves the remaining requests.
+        
+        Args:
+            chunks: List of text chunks
+            difficulty: Difficulty level
+            max_chunks: Maximum number of chunks to process (to avoid timeouts)
+            concurrency: Maximum number of chunks processed at the same time
+            
+        Yields:
+            Quiz questions, in the order their chunks finish
+        """
+        chunks_to_process = self._select_chunks(chunks, max_chunks)
+        not_started = iter(enumerate(chunks_to_process))
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        in_flight = set()
+        
+        def _start(count: int):
+            for i, chunk in itertools.islice(not_started, count):
+                in_flight.add(executor.submit(self._questions_for_chunk, i, chunk, difficulty))
         
+        try:
+            _start(concurrency)
+            generated = 0
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.difference_update(done)
+                for future in done:
+                    for question in future.result():
+                        generated += 1
+                        yield question
+                # Only reached if the caller still wants more questions
+                _start(len(done))
+            if not generated:
+                raise ValueError(f"Failed to generate quiz questions from {len(chunks_to_process)} chunks. The content might be too short or the API returned invalid responses.")
+        finally:
+            executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _select_chunks(chunks: List[str], max_chunks: int) -> List[str]:
+        """Keep the first max_chunks chunks that are long enough to generate questions from"""
         if not chunks:
             raise ValueError("No chunks provided for quiz generation")
         
@@ -144,44 +200,55 @@ class QuizAgent:
             raise ValueError("No valid chunks found. Chunks must be at least 100 characters long.")
         
         # Limit chunks to avoid timeout
-        chunks_to_process = valid_chunks[:max_chunks]
-        
-        for i, chunk in enumerate(chunks_to_process):
-            try:
-                # Ensure chunk has enough content
-                if len(chunk.strip()) < 100:
-                    continue
-                    
-                questions = self.generate_quiz(chunk, num_questions=2, difficulty=difficulty)
-                
-                if questions and len(questions) > 0:
-                    for q in questions:
-                        q['chunk_id'] = i
-                    all_questions.extend(questions)
-                else:
-                    # Try with a simpler prompt if first attempt failed
-                    try:
-                        questions = self.generate_quiz(chunk, num_questions=1, difficulty=difficulty)
-                        if questions:
-                            for q in questions:
-                                q['chunk_id'] = i
-                            all_questions.extend(questions)
-                    except:
-                        pass
-                        
-            except Exception as e:
-                error_msg = str(e)
-                # Don't silently fail - log the error
-                import sys
-                print(f"Error processing chunk {i}: {error_msg}", file=sys.stderr)
-                # Continue with next chunk
-                continue
+        return valid_chunks[:max_chunks]
+    
+    @staticmethod
+    def _combine(results: List[List[Dict]], num_chunks: int) -> List[Dict]:
+        """Flatten per-chunk questions, failing if none were generated"""
+        all_questions = [q for questions in results for q in questions]
         
         if not all_questions:
-            raise ValueError(f"Failed to generate quiz questions from {len(chunks_to_process)} chunks. The content might be too short or the API returned invalid responses.")
+            raise ValueError(f"Failed to generate quiz questions from {num_chunks} chunks. The content might be too short or the API returned invalid responses.")
         
         return all_questions
     
+    def _questions_for_chunk(self, i: int, chunk: str, difficulty: str) -> List[Dict]:
+        """
+        Generate quiz questions for one chunk, retrying with a single question on failure.
+        
+        Args:
+            i: Chunk index (stored as each question's chunk_id)
+            chunk: Chunk text
+            difficulty: Difficulty level
+            
+        Returns:
+            Questions for this chunk (empty if every attempt failed)
+        """
+        try:
+            # Ensure chunk has enough content
+            if len(chunk.strip()) < 100:
+                return []
+                
+            questions = self.generate_quiz(chunk, num_questions=2, difficulty=difficulty)
+            
+            if not questions:
+                # Try with a simpler prompt if first attempt failed
+                try:
+                    questions = self.generate_quiz(chunk, num_questions=1, difficulty=difficulty)
+                except:
+                    questions = []
+            
+            for q in questions or []:
+                q['chunk_id'] = i
+            return questions or []
+                    
+        except Exception as e:
+            error_msg = str(e)
+            # Don't silently fail - log the error
+            import sys
+            print(f"Error processing chunk {i}: {error_msg}", file=sys.stderr)
+            return []
+    
     def evaluate_answer(self, question: Dict, selected_answer: int) -> Dict:
         """
         Evaluate a student's answer to a quiz question.
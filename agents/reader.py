@@ -1,6 +1,6 @@
 """Reader Agent - Extracts and structures content from study materials"""
-from typing import Dict, List
-from utils.pdf_utils import extract_text_from_uploaded_file, clean_text, split_into_chunks
+from typing import Dict, List, Optional
+from utils.pdf_utils import extract_text_from_pdf, save_uploaded_bytes, clean_text, split_into_chunks
 from utils.llm_utils import call_llm, parse_json_response
 from utils.memory import MemoryModule
 import config
@@ -21,6 +21,22 @@ class ReaderAgent:
         Args:
             uploaded_file: Streamlit uploaded file object
             
+        Returns:
+            Dictionary with extracted content and metadata
+        """
+        return self.process_bytes(uploaded_file.getbuffer(), uploaded_file.name)
+    
+    def process_bytes(self, pdf_bytes: bytes, file_name: str, file_path: str = None,
+                      topics: Optional[List[Dict]] = None) -> Dict:
+        """
+        Process an uploaded PDF given as bytes and extract structured content.
+        
+        Args:
+            pdf_bytes: PDF file contents, bytes or any buffer (only read when file_path is None)
+            file_name: Original file name
+            file_path: Where the PDF is already saved (skips saving another copy)
+            topics: Topics already identified for this file (skips the LLM call)
+            
         Returns:
             Dictionary with extracted content and metadata
         """
@@ -28,9 +44,12 @@ class ReaderAgent:
         print(f"\n{'='*60}")
         print(f"READER AGENT: PROCESSING FILE")
         print(f"{'='*60}")
-        print(f"File name: {uploaded_file.name}")
+        print(f"File name: {file_name}")
         
-        raw_text = extract_text_from_uploaded_file(uploaded_file)
+        # Keep a permanent copy of the upload (unless it is one already), then extract from it
+        if file_path is None:
+            file_path = save_uploaded_bytes(pdf_bytes, file_name)
+        raw_text = extract_text_from_pdf(file_path)
         print(f"Raw text extracted: {len(raw_text)} characters")
         print(f"Raw text preview: {raw_text[:200]}...")
         
@@ -49,12 +68,13 @@ class ReaderAgent:
         print(f"Chunk sizes: {[len(c) for c in chunks[:5]]}")
         
         # Identify topics
-        topics = self._identify_topics(cleaned_text)
+        if topics is None:
+            topics = self._identify_topics(cleaned_text)
         print(f"Identified {len(topics)} topics")
         
         # Add chunks to memory for semantic search
         try:
-            metadata = [{"file_name": uploaded_file.name, "chunk_id": i} for i in range(len(chunks))]
+            metadata = [{"file_name": file_name, "chunk_id": i} for i in range(len(chunks))]
             self.memory.add_documents(chunks, metadata)
             print(f"Added {len(chunks)} chunks to memory")
         except Exception as e:
@@ -65,7 +85,9 @@ class ReaderAgent:
             "chunks": chunks,
             "topics": topics,
             "num_chunks": len(chunks),
-            "file_name": uploaded_file.name,
+            "total_chars": sum(map(len, chunks)),
+            "file_name": file_name,
+            "file_path": file_path,
             "file_size": len(cleaned_text)
         }
         
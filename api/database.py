@@ -5,16 +5,23 @@ Stores raw files, chunks/segments, and generated artifacts
 import sqlite3
 import json
 import os
-from typing import List, Dict, Optional
+import logging
+from typing import List, Dict, Iterable, Optional
 from datetime import datetime
 import config
 
+logger = logging.getLogger(__name__)
+
 
 def init_db():
     """Initialize database with all required tables"""
     conn = sqlite3.connect(config.DB_PATH)
     cursor = conn.cursor()
     
+    # WAL is persistent for the database file: readers no longer block on the
+    # writer and commits append to the log instead of rewriting pages
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Files table - store uploaded files info
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS files (
@@ -141,16 +148,61 @@ def init_db():
     print(f"✅ Database initialized at {config.DB_PATH}")
 
 
+class _SharedConnection(sqlite3.Connection):
+    """Connection held open by a `with Database()` block; methods' close() calls are no-ops"""
+    
+    def close(self):
+        pass
+    
+    def close_now(self):
+        super().close()
+
+
 class Database:
-    """Database operations for the API"""
+    """
+    Database operations for the API
+    
+    Each method opens its own connection by default. Inside `with Database() as db:`
+    all methods share one connection (with a larger page cache and mmap I/O)
+    for the duration of the block - use that for batch jobs like process_pdf.
+    The shared connection may be handed between threads but not used by two
+    at once.
+    """
     
     def __init__(self, db_path: str = None):
         self.db_path = db_path or config.DB_PATH
+        self._shared_conn = None
+    
+    def __enter__(self) -> "Database":
+        conn = sqlite3.connect(self.db_path, factory=_SharedConnection, check_same_thread=False)
+        self._configure(conn)
+        conn.execute('PRAGMA mmap_size=268435456')  # 256 MB
+        conn.execute('PRAGMA cache_size=-131072')  # 128 MB
+        self._shared_conn = conn
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._shared_conn.close_now()
+        self._shared_conn = None
+    
+    @staticmethod
+    def _configure(conn: sqlite3.Connection):
+        # With WAL, synchronous=NORMAL only fsyncs at checkpoints
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Get the shared connection inside a `with` block, otherwise open a new one"""
+        if self._shared_conn is not None:
+            return self._shared_conn
+        conn = sqlite3.connect(self.db_path)
+        self._configure(conn)
+        return conn
     
     def add_file(self, file_name: str, file_path: str, file_size: int, 
                  file_type: str = "pdf", raw_text: str = None) -> int:
         """Add uploaded file to database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT id FROM files WHERE file_path = ?', (file_path,))
@@ -174,47 +226,49 @@ class Database:
         conn.close()
         return file_id
     
-    def add_segments(self, file_id: int, segments: List[Dict]):
+    def add_segments(self, file_id: int, segments: Iterable[Dict]):
         """
         Add text segments/chunks to database with commit verification
         
         Args:
             file_id: File ID
-            segments: List of segment dictionaries
+            segments: Segment dictionaries (any iterable; consumed once, as rows are inserted)
             
         Returns:
             Number of segments inserted
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
+            # Take the write lock up front so the delete and all inserts share one transaction
+            cursor.execute('BEGIN IMMEDIATE')
+            
             # Clear existing segments for this file
             cursor.execute('DELETE FROM segments WHERE file_id = ?', (file_id,))
             deleted = cursor.rowcount
             logger.debug(f"db: deleted {deleted} existing segments for file_id={file_id}")
             
-            inserted = 0
-            for seg in segments:
-                cursor.execute(
-                    '''INSERT INTO segments (file_id, chunk_index, text_content, label, topic, 
-                       page_number, start_char, end_char) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (
-                        file_id,
-                        seg.get('chunk_index', 0),
-                        seg.get('text_content', ''),
-                        seg.get('label', ''),
-                        seg.get('topic', ''),
-                        seg.get('page_number', 0),
-                        seg.get('start_char', 0),
-                        seg.get('end_char', 0)
-                    )
+            rows = (
+                (
+                    file_id,
+                    seg.get('chunk_index', 0),
+                    seg.get('text_content', ''),
+                    seg.get('label', ''),
+                    seg.get('topic', ''),
+                    seg.get('page_number', 0),
+                    seg.get('start_char', 0),
+                    seg.get('end_char', 0)
                 )
-                inserted += 1
+                for seg in segments
+            )
+            cursor.executemany(
+                '''INSERT INTO segments (file_id, chunk_index, text_content, label, topic, 
+                   page_number, start_char, end_char) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                rows
+            )
+            inserted = cursor.rowcount  # total over all executemany rows
             
             # CRITICAL: Commit transaction
             conn.commit()
@@ -241,7 +295,7 @@ class Database:
     
     def get_segments(self, file_id: int) -> List[Dict]:
         """Get all segments for a file"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -267,7 +321,7 @@ class Database:
     
     def get_segment_by_id(self, segment_id: int) -> Optional[Dict]:
         """Get a specific segment by ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -289,7 +343,7 @@ class Database:
     
     def get_file(self, file_id: int) -> Optional[Dict]:
         """Get file information"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -309,13 +363,29 @@ class Database:
             }
         return None
     
+    def get_files(self, file_ids: List[int]) -> Dict[int, Dict]:
+        """Get id and name for several files in a single query, keyed by file ID"""
+        if not file_ids:
+            return {}
+        
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(file_ids))
+        cursor.execute(f'SELECT id, file_name FROM files WHERE id IN ({placeholders})', list(file_ids))
+        rows = cursor.fetchall()
+        
+        conn.close()
+        return {
+            row['id']: {'id': row['id'], 'file_name': row['file_name']}
+            for row in rows
+        }
+    
     def save_artifact(self, file_id: int, artifact_type: str, artifact_data: Dict, 
                      metadata: Dict = None):
         """Save generated artifact with commit verification"""
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         try:
@@ -352,7 +422,7 @@ class Database:
     
     def get_artifacts(self, file_id: int, artifact_type: str = None) -> List[Dict]:
         """Get artifacts for a file"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
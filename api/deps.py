@@ -0,0 +1,27 @@
+"""
+Shared service instances for the API routes
+Each service is created once per process and injected with Depends
+"""
+from functools import lru_cache
+
+from api.database import Database
+from api.services.chunking_service import ChunkingService
+from api.services.embedding_service import EmbeddingService
+
+
+@lru_cache(maxsize=None)
+def get_db() -> Database:
+    """Get the shared Database instance"""
+    return Database()
+
+
+@lru_cache(maxsize=None)
+def get_chunking_service() -> ChunkingService:
+    """Get the shared ChunkingService instance"""
+    return ChunkingService()
+
+
+@lru_cache(maxsize=None)
+def get_embedding_service() -> EmbeddingService:
+    """Get the shared EmbeddingService instance (loads the embedding model once)"""
+    return EmbeddingService()
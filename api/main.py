@@ -4,7 +4,7 @@ Main entry point for the API server
 """
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 import uvicorn
@@ -16,13 +16,15 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from api.routes import upload, generate, search
 from api.database import init_db
+from api.deps import get_embedding_service
 from config import DB_PATH
 
 # Initialize FastAPI app
 app = FastAPI(
     title="AI Study Assistant API",
     description="Backend API for PDF processing, RAG-based flashcard/quiz generation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse  # orjson encodes responses faster than stdlib json
 )
 
 # CORS middleware for frontend access
@@ -45,10 +47,18 @@ async def startup_event():
     """Initialize database on startup"""
     init_db()
     print("✅ Database initialized")
+    # Load the shared embedding model once up front instead of on the first request
+    get_embedding_service()
     print(f"✅ API server ready at http://localhost:8000")
     print(f"📚 API docs available at http://localhost:8000/docs")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write any unsaved FAISS vectors to disk"""
+    get_embedding_service().flush()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -2,29 +2,29 @@
 Generate Route - RAG-based flashcard/quiz/planner generation
 Enhanced with proper RAG context retrieval and LLM output validation
 """
-from fastapi import APIRouter, HTTPException, Body
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Body, Depends
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Literal
-import os
-import sys
 import json
+import asyncio
 import logging
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
 from api.database import Database
+from api.deps import get_db, get_embedding_service
 from api.services.embedding_service import EmbeddingService
 from utils.llm_utils import call_llm, parse_json_response
 from utils.prompts import FLASHCARD_PROMPT, QUIZ_PROMPT, PLANNER_PROMPT
+from utils.tokens import pack
 import config
+from collections import Counter
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-db = Database()
-embedding_service = EmbeddingService()
+
+# Token budget for retrieved context in generation prompts
+CONTEXT_TOKEN_BUDGET = 3000
 
 
 class GenerateRequest(BaseModel):
@@ -37,7 +37,11 @@ class GenerateRequest(BaseModel):
 
 
 @router.post("/generate")
-async def generate_artifacts(request: GenerateRequest):
+async def generate_artifacts(
+    request: GenerateRequest,
+    db: Database = Depends(get_db),
+    embedding_service: EmbeddingService = Depends(get_embedding_service)
+):
     """
     Generate flashcards, quizzes, or revision plans using RAG
     
@@ -51,14 +55,18 @@ async def generate_artifacts(request: GenerateRequest):
     7. Return structured JSON
     """
     try:
-        # Step 1: Validate file exists
+        # Steps 1 and 2 are independent - run file lookup and segment fetch concurrently
         logger.debug(f"generate: starting generation for file_id={request.file_id}, type={request.artifact_type}")
-        file_info = db.get_file(request.file_id)
+        file_info, segments = await asyncio.gather(
+            asyncio.to_thread(db.get_file, request.file_id),
+            asyncio.to_thread(db.get_segments, request.file_id)
+        )
+        
+        # Step 1: Validate file exists
         if not file_info:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Step 2: Get segments for the file
-        segments = db.get_segments(request.file_id)
+        # Step 2: Validate segments for the file
         if not segments:
             raise HTTPException(status_code=400, detail="No segments found for this file. Please upload and process the file first.")
         
@@ -72,11 +80,15 @@ async def generate_artifacts(request: GenerateRequest):
             else:
                 temperature = 0.7
         
-        # Step 4: Retrieve context using RAG
-        logger.debug(f"retrieval: retrieving context for file_id={request.file_id}, topic_filter={request.topic_filter}")
-        retrieved_segments = embedding_service.retrieve_context(
+        # Step 4: Retrieve context using RAG, one batched search over the
+        # topic filter plus the document's main topics for better coverage
+        queries = _retrieval_queries(segments, request.topic_filter)
+        logger.debug(f"retrieval: retrieving context for file_id={request.file_id}, queries={queries}")
+        retrieved_segments = await asyncio.to_thread(
+            embedding_service.retrieve_context_multi,
             file_id=request.file_id,
-            query=request.topic_filter,
+            queries=queries,
+            top_k_per_query=3,
             top_k=6,
             namespace="default"
         )
@@ -106,7 +118,8 @@ async def generate_artifacts(request: GenerateRequest):
             truncated_text = text[:2000] if len(text) > 2000 else text
             context_parts.append(f"PAGE {seg.get('page_number', 0)} SEG {chunk_idx} [{topic}]: {truncated_text}")
         
-        context = "\n\n".join(context_parts)
+        # Pack segments by tokens rather than characters so the prompt uses a consistent budget
+        context = pack(context_parts, budget=CONTEXT_TOKEN_BUDGET)
         logger.debug(f"llm: constructed context with {len(context)} characters from {len(retrieved_segments)} segments")
         
         # Step 6: Generate artifacts based on type
@@ -149,7 +162,7 @@ async def generate_artifacts(request: GenerateRequest):
         )
         logger.info(f"db: artifact saved with id={artifact_id}, file_id={request.file_id}")
         
-        return JSONResponse({
+        return {
             "status": "success",
             "file_id": request.file_id,
             "artifact_id": artifact_id,
@@ -160,7 +173,7 @@ async def generate_artifacts(request: GenerateRequest):
                 "temperature": temperature,
                 "segments_used": len(retrieved_segments)
             }
-        })
+        }
     
     except HTTPException:
         raise
@@ -169,6 +182,19 @@ async def generate_artifacts(request: GenerateRequest):
         raise HTTPException(status_code=500, detail=f"Error generating artifacts: {str(e)}")
 
 
+def _retrieval_queries(segments: List[Dict], topic_filter: Optional[str] = None,
+                       max_topics: int = 10) -> List[str]:
+    """Build retrieval queries from the topic filter and the most common segment topics"""
+    topic_counts = Counter(
+        seg['topic'] for seg in segments
+        if seg.get('topic') and seg['topic'] != 'General'
+    )
+    queries = [topic for topic, _ in topic_counts.most_common(max_topics)]
+    if topic_filter:
+        queries.insert(0, topic_filter)
+    return queries
+
+
 def _generate_flashcards(context: str, num_flashcards: int, temperature: float, file_id: int) -> List[Dict]:
     """Generate flashcards using LLM with JSON validation and retry"""
     logger.debug(f"llm: generating {num_flashcards} flashcards, temperature={temperature}, context_length={len(context)}")
@@ -177,7 +203,7 @@ def _generate_flashcards(context: str, num_flashcards: int, temperature: float,
     prompt = f"""You are an educational assistant. Use only the CONTEXT below. Respond with VALID JSON ONLY.
 
 Context:
-{context[:4000]}
+{context}
 
 Instructions: Create exactly {num_flashcards} flashcards in this JSON format:
 [{{"id": "", "topic": "", "question": "", "answer": "", "difficulty": "", "source": {{"doc_id": {file_id}, "segment_id": ""}}}}]
@@ -267,7 +293,7 @@ def _generate_quiz(context: str, num_questions: int, temperature: float, file_id
     prompt = f"""You are an educational assistant. Use only the CONTEXT below. Respond with VALID JSON ONLY.
 
 Context:
-{context[:4000]}
+{context}
 
 Instructions: Create exactly {num_questions} multiple-choice questions in this JSON format:
 [{{"id": "", "question": "", "options": ["A", "B", "C", "D"], "correct_answer": 0, "explanation": "", "difficulty": ""}}]
@@ -1,27 +1,24 @@
 """
 Search Route - Semantic search over document segments
 """
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import Optional
-import os
-import sys
-
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import asyncio
 
 from api.services.embedding_service import EmbeddingService
 from api.database import Database
+from api.deps import get_db, get_embedding_service
 
 router = APIRouter()
-embedding_service = EmbeddingService()
-db = Database()
 
 
 @router.get("/search")
 async def semantic_search(
     query: str = Query(..., description="Search query"),
     file_id: Optional[int] = Query(None, description="Filter by file ID"),
-    k: int = Query(5, description="Number of results to return", ge=1, le=20)
+    k: int = Query(5, description="Number of results to return", ge=1, le=20),
+    db: Database = Depends(get_db),
+    embedding_service: EmbeddingService = Depends(get_embedding_service)
 ):
     """
     Perform semantic search over document segments
@@ -35,8 +32,12 @@ async def semantic_search(
         List of relevant segments with similarity scores
     """
     try:
-        # Perform semantic search
-        results = embedding_service.search(query=query, k=k)
+        # Perform semantic search, scoped to file_id inside the vector store
+        results = embedding_service.search(query=query, k=k, file_id=file_id)
+        
+        # Fetch file info for all unique file IDs in one query
+        file_ids = {metadata['file_id'] for _, _, metadata in results if 'file_id' in metadata}
+        files = await asyncio.to_thread(db.get_files, list(file_ids))
         
         # Format results
         formatted_results = []
@@ -49,28 +50,18 @@ async def semantic_search(
             
             # Add file info if available
             if 'file_id' in metadata:
-                file_info = db.get_file(metadata['file_id'])
+                file_info = files.get(metadata['file_id'])
                 if file_info:
-                    result_item['file'] = {
-                        "id": file_info['id'],
-                        "file_name": file_info['file_name']
-                    }
+                    result_item['file'] = file_info
             
             formatted_results.append(result_item)
         
-        # Filter by file_id if provided
-        if file_id:
-            formatted_results = [
-                r for r in formatted_results
-                if r.get('metadata', {}).get('file_id') == file_id
-            ]
-        
-        return JSONResponse({
+        return {
             "status": "success",
             "query": query,
             "num_results": len(formatted_results),
             "results": formatted_results
-        })
+        }
     
     except Exception as e:
         print(f"❌ Error in semantic search: {str(e)}")
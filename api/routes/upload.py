@@ -2,35 +2,35 @@
 Upload Route - Handle PDF file uploads and text extraction
 Enhanced with comprehensive logging and DB verification
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from typing import Optional
+import asyncio
 import os
-import sys
 from datetime import datetime
 import logging
 
-sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-
 from api.database import Database
-from utils.pdf_utils import extract_text_from_pdf, clean_text
+from api.deps import get_db, get_chunking_service, get_embedding_service
+from utils.pdf_utils import iter_pdf_pages, clean_pages
 from api.services.chunking_service import ChunkingService
-from api.services.embedding_service import EmbeddingService
+from api.services.embedding_service import EmbeddingService, SegmentMeta
 import config
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-db = Database()
-chunking_service = ChunkingService()
-embedding_service = EmbeddingService()
 
 # Initialize logging
 logging.basicConfig(level=logging.DEBUG)
 
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    db: Database = Depends(get_db),
+    chunking_service: ChunkingService = Depends(get_chunking_service),
+    embedding_service: EmbeddingService = Depends(get_embedding_service)
+):
     """
     Upload and process a PDF file
     
@@ -66,18 +66,14 @@ async def upload_file(file: UploadFile = File(...)):
         
         logger.info(f"upload: saved file to {file_path}, size={file_size} bytes")
         
-        # Step 2: Extract text from PDF
+        # Steps 2-3: Extract and clean text page by page (the raw text is never held in full)
         logger.debug(f"extract: starting text extraction from {file_name}")
-        raw_text = extract_text_from_pdf(file_path)
+        cleaned_text = '\n\n'.join(clean_pages(iter_pdf_pages(file_path)))
         
-        if not raw_text or len(raw_text.strip()) == 0:
+        if not cleaned_text:
             raise HTTPException(status_code=400, detail="No text extracted from PDF")
         
-        logger.info(f"extract: extracted {len(raw_text)} characters from PDF")
-        
-        # Step 3: Clean text
-        cleaned_text = clean_text(raw_text)
-        logger.debug(f"extract: cleaned text, final length={len(cleaned_text)} characters")
+        logger.info(f"extract: cleaned text, final length={len(cleaned_text)} characters")
         
         # Step 4: Store file in database
         logger.debug(f"db: inserting file record for {file_name}")
@@ -102,29 +98,34 @@ async def upload_file(file: UploadFile = File(...)):
         
         # Step 7: Create embeddings for segments
         logger.debug(f"embeddings: creating embeddings for {len(segments)} segments, file_id={file_id}")
-        segment_texts = [seg['text_content'] for seg in segments]
-        segment_metadata = [
-            {
-                'file_id': file_id,
-                'segment_id': seg['chunk_index'],
-                'topic': seg.get('topic', ''),
-                'label': seg.get('label', ''),
-                'chunk_index': seg['chunk_index'],
-                'page_number': seg.get('page_number', 0)
-            }
-            for seg in segments
-        ]
-        embedding_ids = [f"file_{file_id}_seg_{seg['chunk_index']}" for seg in segments]
-        
-        embedding_service.add_vectors(
+        segment_texts, segment_metadata, embedding_ids = [], [], []
+        id_prefix = f"file_{file_id}_seg_"
+        for seg in segments:
+            chunk_index = seg['chunk_index']
+            segment_texts.append(seg['text_content'])
+            segment_metadata.append(SegmentMeta(
+                file_id=file_id,
+                segment_id=chunk_index,
+                topic=seg.get('topic', ''),
+                label=seg.get('label', ''),
+                chunk_index=chunk_index,
+                page_number=seg.get('page_number', 0)
+            ))
+            embedding_ids.append(id_prefix + str(chunk_index))
+        
+        # Encoding (and a one-off IVF rebuild past FAISS_IVF_THRESHOLD) is CPU-bound; keep it off the event loop
+        await asyncio.to_thread(
+            embedding_service.add_vectors,
             texts=segment_texts,
             metadata=segment_metadata,
             embedding_ids=embedding_ids,
             namespace="default"
         )
+        # Persist once per upload: the segments are already committed to SQLite
+        await asyncio.to_thread(embedding_service.flush)
         logger.info(f"embeddings: upserted {len(segments)} vectors, file_id={file_id}")
         
-        return JSONResponse({
+        return {
             "status": "success",
             "file_id": file_id,
             "file_name": file.filename,
@@ -132,7 +133,7 @@ async def upload_file(file: UploadFile = File(...)):
             "text_length": len(cleaned_text),
             "num_segments": len(segments),
             "message": "File uploaded and processed successfully"
-        })
+        }
     
     except HTTPException:
         raise
@@ -142,7 +143,7 @@ async def upload_file(file: UploadFile = File(...)):
 
 
 @router.get("/files/{file_id}")
-async def get_file_info(file_id: int):
+async def get_file_info(file_id: int, db: Database = Depends(get_db)):
     """Get file information and processing status"""
     file_info = db.get_file(file_id)
     
@@ -159,7 +160,7 @@ async def get_file_info(file_id: int):
 
 
 @router.get("/document/{file_id}")
-async def get_document(file_id: int):
+async def get_document(file_id: int, db: Database = Depends(get_db)):
     """Get document with artifacts"""
     file_info = db.get_file(file_id)
     
@@ -2,12 +2,23 @@
 Chunking and Labeling Service
 Splits text into segments and labels them with topics
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional, Tuple
 import re
-from utils.pdf_utils import split_into_chunks
+from utils.pdf_utils import iter_chunks_with_offsets
 import config
 
 
+# Keywords used for topic extraction, in priority order
+TOPIC_KEYWORDS = ['introduction', 'conclusion', 'summary', 'example', 'definition',
+                  'theory', 'method', 'result', 'analysis', 'discussion']
+
+# Single case-insensitive alternation so a chunk is scanned once for all keywords
+_TOPIC_KEYWORDS_RE = re.compile('|'.join(map(re.escape, TOPIC_KEYWORDS)), re.IGNORECASE)
+
+# A bulleted or numbered list item at the start of a segment
+_LIST_ITEM_RE = re.compile(r'\s*(?:[-*•]|\d+[.)])\s+')
+
+
 class ChunkingService:
     """Service for chunking text and labeling segments"""
     
@@ -33,20 +44,28 @@ class ChunkingService:
         Returns:
             List of chunk dictionaries with metadata
         """
-        chunks = split_into_chunks(text, self.chunk_size, self.chunk_overlap)
-        
-        segments = []
-        current_pos = 0
+        return list(self.iter_chunks(text, file_id=file_id))
+    
+    def iter_chunks(self, text: str, file_id: int = None) -> Iterator[Dict]:
+        """
+        Yield chunk dictionaries one at a time (see chunk_text)
         
-        for idx, chunk in enumerate(chunks):
-            start_char = current_pos
-            end_char = current_pos + len(chunk)
+        Args:
+            text: Text to chunk
+            file_id: Optional file ID for tracking
             
+        Returns:
+            Iterator over chunk dictionaries with metadata
+        """
+        classify = self._classify
+        
+        for idx, (chunk, start_char, end_char) in enumerate(
+            iter_chunks_with_offsets(text, self.chunk_size, self.chunk_overlap)
+        ):
             # Extract potential topic/label from chunk
-            label = self._extract_label(chunk)
-            topic = self._extract_topic(chunk)
+            label, topic = classify(chunk)
             
-            segments.append({
+            yield {
                 'chunk_index': idx,
                 'text_content': chunk,
                 'label': label,
@@ -54,33 +73,46 @@ class ChunkingService:
                 'start_char': start_char,
                 'end_char': end_char,
                 'page_number': 0  # Will be updated if page info available
-            })
-            
-            current_pos = end_char - self.chunk_overlap
+            }
+    
+    def _classify(self, text: str) -> Tuple[str, str]:
+        """
+        Extract both label and topic for a chunk, splitting out the first line once
         
-        return segments
+        Args:
+            text: Chunk text
+            
+        Returns:
+            Tuple of (label, topic)
+        """
+        first_line = text.split('\n', 1)[0].strip()
+        return self._extract_label(text, first_line), self._extract_topic(text, first_line)
     
-    def _extract_label(self, text: str) -> str:
+    @staticmethod
+    def _is_heading(first_line: str) -> bool:
+        """Check if a line looks like a heading (short and ends with colon or is all caps)"""
+        return len(first_line) < 100 and (first_line.endswith(':') or first_line.isupper())
+    
+    def _extract_label(self, text: str, first_line: str = None) -> str:
         """
         Extract a label for the chunk (e.g., heading, paragraph, list)
         
         Args:
             text: Chunk text
+            first_line: Optional pre-split first line of the chunk
             
         Returns:
             Label string
         """
-        text_lower = text.lower().strip()
-        
-        # Check for headings (lines that are short and end with colon or are all caps)
-        lines = text.split('\n')
-        first_line = lines[0].strip() if lines else ""
+        if first_line is None:
+            first_line = text.split('\n', 1)[0].strip()
         
-        if len(first_line) < 100 and (first_line.endswith(':') or first_line.isupper()):
+        # Check for headings
+        if self._is_heading(first_line):
             return "heading"
         
         # Check for lists
-        if re.match(r'^\s*[-*•]\s+', text) or re.match(r'^\s*\d+[.)]\s+', text):
+        if _LIST_ITEM_RE.match(text):
             return "list"
         
         # Check for code blocks
@@ -90,31 +122,35 @@ class ChunkingService:
         # Default to paragraph
         return "paragraph"
     
-    def _extract_topic(self, text: str) -> str:
+    def _extract_topic(self, text: str, first_line: str = None) -> str:
         """
         Extract topic from chunk (simple keyword-based extraction)
         
         Args:
             text: Chunk text
+            first_line: Optional pre-split first line of the chunk
             
         Returns:
             Topic string
         """
-        # Look for common topic indicators
-        lines = text.split('\n')
-        first_line = lines[0].strip() if lines else ""
+        if first_line is None:
+            first_line = text.split('\n', 1)[0].strip()
         
         # If first line looks like a heading, use it as topic
-        if len(first_line) < 100 and (first_line.endswith(':') or first_line.isupper()):
+        if self._is_heading(first_line):
             return first_line.replace(':', '').strip()
         
-        # Extract keywords (simple approach - can be enhanced with NLP)
-        keywords = ['introduction', 'conclusion', 'summary', 'example', 'definition', 
-                   'theory', 'method', 'result', 'analysis', 'discussion']
+        # Extract keywords in a single pass (simple approach - can be enhanced with NLP)
+        found = set()
+        for match in _TOPIC_KEYWORDS_RE.finditer(text):
+            keyword = match.group(0).lower()
+            if keyword == TOPIC_KEYWORDS[0]:
+                return keyword.capitalize()
+            found.add(keyword)
         
-        text_lower = text.lower()
-        for keyword in keywords:
-            if keyword in text_lower:
+        # Keep keyword priority order when several match
+        for keyword in TOPIC_KEYWORDS:
+            if keyword in found:
                 return keyword.capitalize()
         
         return "General"
@@ -4,12 +4,226 @@ Handles vector embeddings and similarity search
 """
 import os
 import pickle
+import hashlib
+import logging
+import threading
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+import orjson
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Tuple, Optional, Iterable
 import faiss
 from sentence_transformers import SentenceTransformer
 import config
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None  # Segment texts/metadata are pickled instead of stored as Parquet
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of query embeddings kept in the in-process LRU cache
+QUERY_CACHE_SIZE = 4096
+
+# Generic query used to pull a document's segments from Pinecone when no query is given
+GENERIC_PROBE_QUERY = "document content"
+
+# Vectors sampled to train the OPQ + IVF-PQ index when upgrading from flat search
+FAISS_TRAIN_SAMPLE = 100000
+# Headroom added on each side of the int8 range learned from the first batch, as a fraction
+# of its width, so later vectors with slightly larger components are not clipped
+SQ8_RANGE_MARGIN = 0.5
+
+
+def _configure_threads(num_threads: int):
+    """
+    Pin torch and FAISS (OpenMP) to the same thread count
+    
+    Both otherwise pick their own defaults, which typically counts hyperthreads
+    and oversubscribes the cores when encode and search run side by side.
+    
+    Args:
+        num_threads: Threads per library
+    """
+    import torch
+    torch.set_num_threads(num_threads)
+    faiss.omp_set_num_threads(num_threads)
+
+
+@lru_cache(maxsize=None)
+def _load_sentence_transformer(model_name: str, backend: str, dtype: str) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer on the given inference backend and precision
+    
+    Cached per (model, backend, dtype), so every EmbeddingService in the process
+    shares one copy of the weights instead of reloading them.
+    
+    "onnx" (ONNX Runtime) and "openvino" run a fused, exported graph that is
+    typically several times faster than PyTorch on CPU; the export happens on
+    first load. Falls back to PyTorch if the backend is unavailable.
+    
+    dtype then picks the precision: "float16" halves the PyTorch weights on
+    GPU, "int8" uses a dynamically quantized ONNX model (implies the onnx
+    backend). "float32" keeps full precision.
+    
+    Args:
+        model_name: Model name or path
+        backend: "torch", "onnx" or "openvino" (config.EMBEDDING_BACKEND)
+        dtype: "float32", "float16" or "int8" (config.EMBEDDING_DTYPE)
+        
+    Returns:
+        Loaded SentenceTransformer
+    """
+    if dtype == "int8":
+        backend = "onnx"
+    
+    model = None
+    if backend != "torch":
+        try:
+            model = SentenceTransformer(model_name, backend=backend)
+        except Exception as e:
+            print(f"⚠️ Could not load {model_name} with {backend} backend: {e}. Using torch...")
+            backend = "torch"
+    if model is None:
+        model = SentenceTransformer(model_name)
+    
+    if dtype == "int8" and backend == "onnx":
+        try:
+            model = _load_int8_model(model, model_name)
+        except Exception as e:
+            print(f"⚠️ Could not quantize {model_name} to int8: {e}. Using float32...")
+    elif dtype == "float16" and backend == "torch" and model.device.type == "cuda":
+        model.half()
+    
+    return model
+
+
+def _load_int8_model(model: SentenceTransformer, model_name: str) -> SentenceTransformer:
+    """Load (exporting on first use) a dynamically int8-quantized copy of an ONNX model"""
+    quantized_dir = os.path.join(config.OUTPUT_DIR, "embedding_int8", model_name.replace('/', '__'))
+    file_name = "onnx/model_qint8_avx512_vnni.onnx"
+    
+    if not os.path.exists(os.path.join(quantized_dir, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        print(f"Quantizing {model_name} to int8 (one-time export to {quantized_dir})...")
+        model.save(quantized_dir)
+        export_dynamic_quantized_onnx_model(model, "avx512_vnni", quantized_dir)
+    
+    return SentenceTransformer(quantized_dir, backend="onnx", model_kwargs={"file_name": file_name})
+
+
+@dataclass(slots=True)
+class SegmentMeta:
+    """Metadata stored with each segment vector"""
+    file_id: int
+    segment_id: int
+    topic: str = ""
+    label: str = ""
+    chunk_index: int = 0
+    page_number: int = 0
+    
+    def to_dict(self) -> Dict:
+        return {
+            'file_id': self.file_id,
+            'segment_id': self.segment_id,
+            'topic': self.topic,
+            'label': self.label,
+            'chunk_index': self.chunk_index,
+            'page_number': self.page_number
+        }
+
+
+class _LazyRows:
+    """
+    Append-only list whose leading rows are read lazily from on-disk storage
+    
+    Rows loaded from disk (an Arrow column or a UTF-8 text blob) stay
+    in their compact buffers and become Python objects only when accessed;
+    rows added since the load are kept in a plain list.
+    
+    Args:
+        source: Backing storage, kept so it can be written back out
+        length: Number of rows in source
+        read: Function mapping a row index (< length) to its value
+    """
+    
+    def __init__(self, source, length: int, read):
+        self.source = source
+        self._length = length
+        self._read = read
+        self._tail = []
+    
+    @classmethod
+    def from_arrow(cls, column, decode=None) -> "_LazyRows":
+        """Wrap an Arrow string column, optionally decoding each value"""
+        if decode:
+            return cls(column, len(column), lambda idx: decode(column[idx].as_py()))
+        return cls(column, len(column), lambda idx: column[idx].as_py())
+    
+    def __len__(self) -> int:
+        return self._length + len(self._tail)
+    
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += len(self)
+        if idx < self._length:
+            return self._read(idx)
+        return self._tail[idx - self._length]
+    
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+    
+    def extend(self, values: Iterable):
+        self._tail.extend(values)
+
+
+def _string_column(values, encode=None):
+    """Build an Arrow string column from a list or Arrow-backed _LazyRows, encoding new rows"""
+    if isinstance(values, _LazyRows) and isinstance(values.source, pa.ChunkedArray):
+        chunks = values.source.chunks
+        values = values._tail
+    else:
+        chunks = []
+    if encode:
+        values = [encode(value) for value in values]
+    return pa.chunked_array(chunks + [pa.array(values, type=pa.string())], type=pa.string())
+
+
+def _encode_metadata(meta: Dict) -> str:
+    return orjson.dumps(meta, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+
+def _write_text_blob(texts, blob_path: str, offsets_path: str):
+    """Write texts as one UTF-8 blob plus an int64 array of N+1 byte offsets"""
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(data) for data in encoded], dtype=np.int64)
+    with open(blob_path, 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(offsets_path, 'wb') as f:
+        np.save(f, offsets)
+
+
+def _read_text_blob(blob_path: str, offsets_path: str) -> _LazyRows:
+    """
+    Load a text blob written by _write_text_blob
+    
+    The blob is read into one bytes object rather than memory-mapped, since
+    save_faiss_index replaces these files and a mapped file can't be replaced on Windows
+    """
+    offsets = np.load(offsets_path)
+    with open(blob_path, 'rb') as f:
+        blob = f.read()
+    return _LazyRows(
+        blob,
+        len(offsets) - 1,
+        lambda idx: blob[offsets[idx]:offsets[idx + 1]].decode('utf-8')
+    )
+
 
 class EmbeddingService:
     """Service for managing embeddings and vector search"""
@@ -24,43 +238,130 @@ class EmbeddingService:
         """
         self.use_pinecone = use_pinecone
         self.embedding_model = None
+        self.model_name = config.EMBEDDING_MODEL
+        self._query_cache = OrderedDict()  # sha1(model|query) -> embedding, LRU order
+        self._query_cache_lock = threading.Lock()
+        # Guards the FAISS index and its row-aligned state (texts, metadata, file_id rows, save
+        # bookkeeping): routes search from worker threads while uploads add vectors
+        self._index_lock = threading.RLock()
+        self._upgrading = False  # an IVF rebuild is running outside the lock
+        self._generic_probe_embedding = None  # embedding of GENERIC_PROBE_QUERY (Pinecone only)
         self.faiss_index = None
         self.texts = []
         self.metadata = []
+        self._file_id_to_indices = {}  # file_id -> FAISS row indices, for filtered search
+        self._file_selectors = {}  # file_id -> (int64 row ids, IDSelectorBatch), built lazily
+        self._gpu_resources = None
+        self._gpu_index = None  # GPU replica of faiss_index for unfiltered search (False if unsupported)
         self.dimension = config.EMBEDDING_DIMENSION
-        self.index_path = os.path.join(config.OUTPUT_DIR, "faiss_index.bin")
-        self.metadata_path = os.path.join(config.OUTPUT_DIR, "faiss_metadata.pkl")
+        # Own file names: utils/memory.py's MemoryModule keeps faiss_index.bin / faiss_metadata.pkl
+        self.index_path = os.path.join(config.OUTPUT_DIR, "api_faiss_index.bin")
+        self.segments_path = os.path.join(config.OUTPUT_DIR, "api_faiss_segments.parquet")
+        self.metadata_path = os.path.join(config.OUTPUT_DIR, "api_faiss_legacy.pkl")  # without pyarrow
+        self.texts_path = os.path.join(config.OUTPUT_DIR, "api_faiss_texts.bin")  # without pyarrow
+        self.text_offsets_path = os.path.join(config.OUTPUT_DIR, "api_faiss_text_offsets.npy")  # without pyarrow
+        self._dirty = False  # in-memory FAISS index has vectors not yet written to disk
+        self._save_every = config.FAISS_SAVE_EVERY
+        self._last_save_ntotal = 0
         
         # Initialize embedding model
+        _configure_threads(config.NUM_THREADS)
         self._load_embedding_model()
         
         # Initialize vector store
         if use_pinecone:
             self._init_pinecone(pinecone_api_key)
+            # Encoded once here so query-less retrieval never runs the model
+            self._generic_probe_embedding = self.create_embeddings([GENERIC_PROBE_QUERY], show_progress=False)[0]
         else:
+            self._init_faiss_gpu()
             self._load_or_create_faiss_index()
     
     def _load_embedding_model(self):
         """Load the embedding model"""
         try:
             print(f"Loading embedding model: {config.EMBEDDING_MODEL}")
-            self.embedding_model = SentenceTransformer(config.EMBEDDING_MODEL)
+            self.embedding_model = _load_sentence_transformer(
+                config.EMBEDDING_MODEL, config.EMBEDDING_BACKEND, config.EMBEDDING_DTYPE
+            )
             print("✅ Embedding model loaded")
         except Exception as e:
             print(f"⚠️ Error loading model {config.EMBEDDING_MODEL}: {e}")
             print("Falling back to all-MiniLM-L6-v2...")
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = _load_sentence_transformer(
+                'all-MiniLM-L6-v2', config.EMBEDDING_BACKEND, config.EMBEDDING_DTYPE
+            )
+            self.model_name = 'all-MiniLM-L6-v2'
             self.dimension = 384
     
+    def _init_faiss_gpu(self):
+        """Set up GPU resources if FAISS was built with GPU support and a GPU is present"""
+        if not config.FAISS_USE_GPU or not hasattr(faiss, 'StandardGpuResources'):
+            return
+        try:
+            if faiss.get_num_gpus() > 0:
+                self._gpu_resources = faiss.StandardGpuResources()
+                print("✅ FAISS GPU search enabled")
+        except Exception as e:
+            print(f"⚠️ Could not initialize FAISS GPU resources: {e}")
+    
+    def _get_search_index(self):
+        """
+        Get the index to run unfiltered searches on
+        
+        The CPU index stays authoritative for adds, saves and filtered searches
+        (GPU indexes do not take ID selectors); a GPU copy is built lazily after
+        each change and used for plain searches when the index type supports it.
+        """
+        if self._gpu_resources is None or self._gpu_index is False:
+            return self.faiss_index
+        if self._gpu_index is None:
+            try:
+                self._gpu_index = faiss.index_cpu_to_gpu(self._gpu_resources, 0, self.faiss_index)
+            except Exception as e:
+                logger.warning(f"retrieval: index type not supported on GPU, searching on CPU: {str(e)}")
+                self._gpu_index = False
+                return self.faiss_index
+        return self._gpu_index
+    
     def _load_or_create_faiss_index(self):
         """Load existing FAISS index or create new one"""
-        if os.path.exists(self.index_path) and os.path.exists(self.metadata_path):
+        index_path, segments_path = self.index_path, self.segments_path
+        legacy_segments_path = os.path.join(config.OUTPUT_DIR, "faiss_segments.parquet")
+        migrating = (
+            not os.path.exists(index_path)
+            and pa is not None
+            and os.path.exists(legacy_segments_path)
+        )
+        if migrating:
+            # Written before the API had its own file names; if MemoryModule has since
+            # overwritten faiss_index.bin, the row-count check below rejects the pair
+            index_path = os.path.join(config.OUTPUT_DIR, "faiss_index.bin")
+            segments_path = legacy_segments_path
+        has_segments = (
+            (pa is not None and os.path.exists(segments_path))
+            or os.path.exists(self.metadata_path)
+        )
+        if os.path.exists(index_path) and has_segments:
             try:
-                self.faiss_index = faiss.read_index(self.index_path)
-                with open(self.metadata_path, 'rb') as f:
-                    data = pickle.load(f)
-                    self.texts = data.get('texts', [])
-                    self.metadata = data.get('metadata', [])
+                self.faiss_index = faiss.read_index(index_path)
+                if self.faiss_index.metric_type != faiss.METRIC_INNER_PRODUCT:
+                    self._migrate_to_cosine()
+                    self._dirty = True
+                ivf_index = faiss.try_extract_index_ivf(self.faiss_index)
+                if ivf_index is not None:
+                    ivf_index.nprobe = config.FAISS_NPROBE
+                self._load_segments(segments_path)
+                if self.faiss_index.ntotal != len(self.texts) or len(self.texts) != len(self.metadata):
+                    # A save was interrupted between swapping the segments and the index
+                    raise ValueError(
+                        f"index has {self.faiss_index.ntotal} vectors but segments have "
+                        f"{len(self.texts)} texts / {len(self.metadata)} metadata rows"
+                    )
+                self._gpu_index = None
+                self._last_save_ntotal = self.faiss_index.ntotal
+                if migrating:
+                    self._dirty = True  # write it under the API's own names on the next flush
                 print(f"✅ Loaded FAISS index with {len(self.texts)} vectors")
             except Exception as e:
                 print(f"⚠️ Error loading index: {e}. Creating new index...")
@@ -68,13 +369,169 @@ class EmbeddingService:
         else:
             self._create_faiss_index()
     
+    def _load_segments(self, segments_path: str):
+        """Load segment texts and metadata from Parquet, or from the text blob + metadata pickle"""
+        if pa is not None and os.path.exists(segments_path):
+            # Read fully into memory: a mapped file can't be replaced on Windows, which would break saves
+            table = pq.read_table(segments_path)
+            self.texts = _LazyRows.from_arrow(table.column('text'))
+            self.metadata = _LazyRows.from_arrow(table.column('metadata'), decode=orjson.loads)
+            self._index_file_ids(table.column('file_id').to_pylist(), start_idx=0)
+            return
+        
+        with open(self.metadata_path, 'rb') as f:
+            data = pickle.load(f)
+            self.metadata = data.get('metadata', [])
+        self.texts = _read_text_blob(self.texts_path, self.text_offsets_path)
+        self._index_file_ids((meta.get('file_id') for meta in self.metadata), start_idx=0)
+        if pa is not None:
+            self._dirty = True  # rewrite the legacy pickle as Parquet on the next flush
+    
     def _create_faiss_index(self):
-        """Create a new FAISS index"""
-        self.faiss_index = faiss.IndexFlatL2(self.dimension)
+        """Create a new FAISS index (exact flat search until the corpus grows, see _maybe_upgrade_to_ivf)"""
+        self.faiss_index = self._new_flat_index()
         self.texts = []
         self.metadata = []
+        self._file_id_to_indices = {}
+        self._file_selectors = {}
+        self._gpu_index = None
         print("✅ Created new FAISS index")
     
+    def _new_flat_index(self):
+        """
+        Exact inner-product index over int8- (or FP16-) stored vectors
+        
+        Embeddings are L2-normalized, so inner product equals cosine similarity
+        (what BGE models are trained for). Scoring is bound by memory bandwidth,
+        so storing 1 byte per dimension (config.FAISS_FLAT_STORAGE="int8")
+        instead of 4 cuts that traffic 4x; FAISS decodes the codes on the fly.
+        Every component of a unit vector lies in [-1, 1], so a single value range
+        for all dimensions (learned on the first batch, see _train_if_needed)
+        loses little recall.
+        """
+        if config.FAISS_FLAT_STORAGE == "fp16":
+            return faiss.IndexScalarQuantizer(
+                self.dimension,
+                faiss.ScalarQuantizer.QT_fp16,
+                faiss.METRIC_INNER_PRODUCT
+            )
+        index = faiss.IndexScalarQuantizer(
+            self.dimension,
+            faiss.ScalarQuantizer.QT_8bit_uniform,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        index.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        index.sq.rangestat_arg = SQ8_RANGE_MARGIN
+        return index
+    
+    def _train_if_needed(self, vectors: np.ndarray):
+        """Learn the int8 value range from the first vectors added to an empty flat index"""
+        if not self.faiss_index.is_trained:
+            self.faiss_index.train(vectors)
+    
+    def _migrate_to_cosine(self):
+        """Rebuild a legacy L2 index from disk as a normalized inner-product index"""
+        ntotal = self.faiss_index.ntotal
+        print(f"Migrating FAISS index with {ntotal} vectors to cosine similarity...")
+        vectors = self.faiss_index.reconstruct_n(0, ntotal) if ntotal else None
+        self.faiss_index = self._new_flat_index()
+        if vectors is not None:
+            faiss.normalize_L2(vectors)
+            self._train_if_needed(vectors)
+            self.faiss_index.add(vectors)
+    
+    def _maybe_upgrade_to_ivf(self):
+        """
+        Rebuild a flat index as OPQ + IVF-PQ once it reaches config.FAISS_IVF_THRESHOLD vectors
+        
+        Flat search scores every vector on each query; IVF-PQ only scans nprobe
+        inverted lists of compressed codes. An OPQ rotation reduces the vectors
+        to 4*M dims (256 for bge-large) first, which balances the variance across
+        the M sub-quantizers and improves PQ recall at 64 bytes per vector.
+        Vectors are re-added in the same order, so row indices (used for metadata
+        and file_id filtering) stay stable.
+        
+        The new index is trained and filled outside _index_lock, so searches and
+        adds keep using the flat index meanwhile; rows added during the rebuild
+        are copied over when it is swapped in.
+        """
+        with self._index_lock:
+            ntotal = self.faiss_index.ntotal
+            if (self._upgrading or ntotal < config.FAISS_IVF_THRESHOLD
+                    or faiss.try_extract_index_ivf(self.faiss_index) is not None):
+                return
+            self._upgrading = True
+            vectors = self.faiss_index.reconstruct_n(0, ntotal)
+        
+        try:
+            nlist = max(1, int(4 * np.sqrt(ntotal)))
+            pq_m = max(1, self.dimension // 16)  # sub-quantizers
+            factory = f"OPQ{pq_m}_{4 * pq_m},IVF{nlist},PQ{pq_m}x8"
+            logger.info(f"embeddings: upgrading FAISS index to {factory} at {ntotal} vectors")
+            
+            index = faiss.index_factory(self.dimension, factory, faiss.METRIC_INNER_PRODUCT)
+            # OPQ training is iterative; a sample of the corpus is enough
+            if ntotal > FAISS_TRAIN_SAMPLE:
+                sample = np.random.default_rng(0).choice(ntotal, FAISS_TRAIN_SAMPLE, replace=False)
+                index.train(vectors[np.sort(sample)])
+            else:
+                index.train(vectors)
+            index.add(vectors)
+            faiss.extract_index_ivf(index).nprobe = config.FAISS_NPROBE
+            
+            with self._index_lock:
+                added = self.faiss_index.ntotal - ntotal
+                if added:
+                    index.add(self.faiss_index.reconstruct_n(ntotal, added))
+                self.faiss_index = index
+                self._gpu_index = None
+                self._dirty = True
+        finally:
+            self._upgrading = False
+    
+    def _search_params(self, selector) -> "faiss.SearchParameters":
+        """Build search parameters carrying an ID selector for the current index type"""
+        ivf_index = faiss.try_extract_index_ivf(self.faiss_index)
+        if ivf_index is not None:
+            # IVF indexes require IVF parameters; keep the configured nprobe
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf_index.nprobe)
+            if isinstance(self.faiss_index, faiss.IndexPreTransform):
+                # The OPQ wrapper forwards only its own parameter type to the IVF index
+                wrapper = faiss.SearchParametersPreTransform()
+                wrapper.index_params = params
+                wrapper.referenced_objects = [params]  # keep the IVF params alive with the wrapper
+                return wrapper
+            return params
+        return faiss.SearchParameters(sel=selector)
+    
+    def _index_file_ids(self, file_ids: Iterable, start_idx: int):
+        """Record which FAISS rows belong to each file_id"""
+        for offset, file_id in enumerate(file_ids):
+            if file_id is not None:
+                self._file_id_to_indices.setdefault(file_id, []).append(start_idx + offset)
+                self._file_selectors.pop(file_id, None)
+    
+    def _file_selector(self, file_id: int):
+        """
+        Get the cached FAISS ID selector for a file's rows
+        
+        Args:
+            file_id: File ID to restrict the search to
+            
+        Returns:
+            IDSelectorBatch over the file's row ids, or None if the file has no rows
+        """
+        cached = self._file_selectors.get(file_id)
+        if cached is None:
+            file_indices = self._file_id_to_indices.get(file_id)
+            if not file_indices:
+                return None
+            ids = np.asarray(file_indices, dtype='int64')
+            # Keep the id array alongside the selector so its memory outlives every search
+            cached = (ids, faiss.IDSelectorBatch(ids))
+            self._file_selectors[file_id] = cached
+        return cached[1]
+    
     def _init_pinecone(self, api_key: str):
         """Initialize Pinecone (if enabled)"""
         if not api_key:
@@ -87,18 +544,24 @@ class EmbeddingService:
             index_name = "study-assistant"
             if index_name not in pinecone.list_indexes():
                 pinecone.create_index(index_name, dimension=self.dimension)
-            self.pinecone_index = pinecone.Index(index_name)
+            try:
+                # gRPC client (pinecone-client[grpc]) has lower per-request overhead for upserts
+                self.pinecone_index = pinecone.GRPCIndex(index_name)
+            except Exception:
+                self.pinecone_index = pinecone.Index(index_name, pool_threads=config.PINECONE_POOL_THREADS)
             print("✅ Pinecone initialized")
         except ImportError:
             raise ImportError("pinecone-client not installed. Install with: pip install pinecone-client")
     
-    def create_embeddings(self, texts: List[str], show_progress: bool = True) -> np.ndarray:
+    def create_embeddings(self, texts: List[str], show_progress: bool = True,
+                          parallel: bool = False) -> np.ndarray:
         """
         Create embeddings for a list of texts
         
         Args:
             texts: List of text strings
             show_progress: Whether to show progress bar
+            parallel: Encode large CPU batches in worker processes (bulk ingest only)
             
         Returns:
             Numpy array of embeddings
@@ -106,27 +569,123 @@ class EmbeddingService:
         if not texts:
             return np.array([])
         
-        embeddings = self.embedding_model.encode(
-            texts,
-            show_progress_bar=show_progress,
-            convert_to_numpy=True
-        )
-        return embeddings.astype('float32')
+        embeddings = None
+        if (parallel and config.EMBEDDING_PROCESSES > 1
+                and self.embedding_model.device.type == "cpu"
+                and len(texts) >= config.EMBEDDING_PROCESSES * config.EMBEDDING_BATCH_SIZE):
+            embeddings = self._encode_multi_process(texts)
+        if embeddings is None:
+            # SentenceTransformer.encode already sorts inputs by length before batching
+            # (and restores the order), so each batch is padded only to similar lengths
+            embeddings = self.embedding_model.encode(
+                texts,
+                batch_size=min(config.EMBEDDING_BATCH_SIZE, len(texts)),
+                show_progress_bar=show_progress,
+                convert_to_numpy=True
+            )
+        # No-op when the model already returns C-ordered float32 (the common case); FAISS needs both
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        # Unit-length vectors so inner-product search is cosine similarity
+        faiss.normalize_L2(embeddings)
+        return embeddings
+    
+    def _encode_multi_process(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Encode texts data-parallel across config.EMBEDDING_PROCESSES CPU worker processes
+        
+        Each worker gets an equal share of config.NUM_THREADS, so the workers
+        together don't oversubscribe the cores.
+        
+        Args:
+            texts: List of text strings
+            
+        Returns:
+            Numpy array of embeddings, or None if the worker pool could not be used
+        """
+        processes = config.EMBEDDING_PROCESSES
+        # Spawned workers read OMP_NUM_THREADS when they import torch
+        previous_threads = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(max(1, config.NUM_THREADS // processes))
+        try:
+            pool = self.embedding_model.start_multi_process_pool(target_devices=["cpu"] * processes)
+        except Exception as e:
+            logger.warning(f"embeddings: could not start encode worker pool, using one process: {str(e)}")
+            return None
+        finally:
+            if previous_threads is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = previous_threads
+        
+        try:
+            logger.info(f"embeddings: encoding {len(texts)} texts on {processes} worker processes")
+            return self.embedding_model.encode_multi_process(
+                texts, pool, batch_size=config.EMBEDDING_BATCH_SIZE
+            )
+        finally:
+            self.embedding_model.stop_multi_process_pool(pool)
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Create the embedding for a single query (cached, see embed_queries)
+        
+        Args:
+            query: Query text
+            
+        Returns:
+            1-D numpy array with the query embedding
+        """
+        return self.embed_queries([query])[0]
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Create embeddings for queries, reusing cached embeddings of repeated queries
+        
+        Cache misses are encoded together in one batch. The cache is an LRU keyed
+        by a hash of the model name and query text.
+        
+        Args:
+            queries: Query texts
+            
+        Returns:
+            Numpy array of shape (len(queries), dim)
+        """
+        keys = [
+            hashlib.sha1(f"{self.model_name}|{query}".encode('utf-8')).digest()
+            for query in queries
+        ]
+        
+        with self._query_cache_lock:
+            cached = [self._query_cache.get(key) for key in keys]
+            for key, embedding in zip(keys, cached):
+                if embedding is not None:
+                    self._query_cache.move_to_end(key)
+        
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if missing:
+            new_embeddings = self.create_embeddings([queries[i] for i in missing], show_progress=False)
+            with self._query_cache_lock:
+                for i, embedding in zip(missing, new_embeddings):
+                    cached[i] = embedding
+                    self._query_cache[keys[i]] = embedding
+                while len(self._query_cache) > QUERY_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+        
+        return np.vstack(cached)
     
     def add_vectors(self, texts: List[str], metadata: List[Dict] = None, 
-                   embedding_ids: List[str] = None, namespace: str = "default"):
+                   embedding_ids: List[str] = None, namespace: str = "default",
+                   parallel: bool = False):
         """
         Add vectors to the index with proper metadata linking
         
         Args:
             texts: List of text strings
-            metadata: Optional metadata for each text (must include segment_id, file_id)
+            metadata: Optional SegmentMeta (or dict with segment_id, file_id) for each text
             embedding_ids: Optional IDs for embeddings
             namespace: Namespace/collection name (for Pinecone)
+            parallel: Encode in worker processes (see create_embeddings)
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         if not texts:
             logger.warning("embeddings: no texts provided for upsert")
             return
@@ -134,23 +693,37 @@ class EmbeddingService:
         logger.debug(f"embeddings: creating embeddings for {len(texts)} texts")
         
         # Create embeddings
-        embeddings = self.create_embeddings(texts, show_progress=True)
+        embeddings = self.create_embeddings(texts, show_progress=True, parallel=parallel)
         
         if self.use_pinecone:
             # Add to Pinecone with namespace
             vectors = []
-            for i, (text, emb) in enumerate(zip(texts, embeddings)):
+            # One C-level conversion for the whole batch instead of one per vector
+            for i, (text, emb) in enumerate(zip(texts, embeddings.tolist())):
                 vector_id = embedding_ids[i] if embedding_ids else f"vec_{i}"
                 meta = metadata[i] if metadata else {}
+                if isinstance(meta, SegmentMeta):
+                    meta = meta.to_dict()  # required fields are guaranteed
+                else:
+                    # Ensure required metadata fields
+                    meta.setdefault('segment_id', f"seg_{i}")
+                    meta.setdefault('file_id', 0)
                 meta['text'] = text
-                # Ensure required metadata fields
-                if 'segment_id' not in meta:
-                    meta['segment_id'] = meta.get('segment_id', f"seg_{i}")
-                if 'file_id' not in meta:
-                    meta['file_id'] = meta.get('file_id', 0)
-                vectors.append((vector_id, emb.tolist(), meta))
+                vectors.append((vector_id, emb, meta))
             
-            self.pinecone_index.upsert(vectors=vectors, namespace=namespace)
+            # Send fixed-size batches concurrently instead of one large blocking request
+            batch_size = config.PINECONE_UPSERT_BATCH
+            futures = [
+                self.pinecone_index.upsert(
+                    vectors=vectors[start:start + batch_size],
+                    namespace=namespace,
+                    async_req=True
+                )
+                for start in range(0, len(vectors), batch_size)
+            ]
+            for future in futures:
+                # REST returns an AsyncResult, gRPC a concurrent future
+                future.result() if hasattr(future, 'result') else future.get()
             logger.debug(f"embeddings: upserted {len(vectors)} vectors to Pinecone namespace={namespace}")
             
             # Verify upsert by querying count
@@ -162,28 +735,48 @@ class EmbeddingService:
                 logger.warning(f"embeddings: could not verify Pinecone count: {str(e)}")
         else:
             # Add to FAISS
-            start_idx = len(self.texts)
-            self.faiss_index.add(embeddings)
-            self.texts.extend(texts)
-            if metadata:
-                self.metadata.extend(metadata)
-            else:
-                self.metadata.extend([{}] * len(texts))
-            
-            # Save index
-            self.save_faiss_index()
-            
-            # Verify by checking index size
-            index_size = self.faiss_index.ntotal
-            logger.debug(f"embeddings: upserted {len(texts)} vectors to FAISS, total index size={index_size}")
+            with self._index_lock:
+                start_idx = len(self.texts)
+                self._train_if_needed(embeddings)
+                self.faiss_index.add(embeddings)
+                self.texts.extend(texts)
+                if metadata:
+                    file_ids = [
+                        meta.file_id if isinstance(meta, SegmentMeta) else meta.get('file_id')
+                        for meta in metadata
+                    ]
+                    self.metadata.extend(
+                        meta.to_dict() if isinstance(meta, SegmentMeta) else meta
+                        for meta in metadata
+                    )
+                    self._index_file_ids(file_ids, start_idx)
+                else:
+                    self.metadata.extend([{}] * len(texts))
+                
+                self._gpu_index = None  # GPU copy is stale now
+                
+                # Snapshot to disk only every FAISS_SAVE_EVERY vectors. Owners must call flush()
+                # before exiting (the API does after each upload); vectors added since the last
+                # snapshot are lost if the process is killed first.
+                self._dirty = True
+                if self.faiss_index.ntotal - self._last_save_ntotal >= self._save_every:
+                    self.save_faiss_index()
+                
+                # Verify by checking index size
+                index_size = self.faiss_index.ntotal
+                logger.debug(f"embeddings: upserted {len(texts)} vectors to FAISS, total index size={index_size}")
+                
+                if index_size < start_idx + len(texts):
+                    logger.warning(f"embeddings: index size mismatch: expected >= {start_idx + len(texts)}, got {index_size}")
             
-            if index_size < start_idx + len(texts):
-                logger.warning(f"embeddings: index size mismatch: expected >= {start_idx + len(texts)}, got {index_size}")
+            # Switch to approximate search once the corpus is large enough
+            self._maybe_upgrade_to_ivf()
         
         logger.info(f"embeddings: successfully added {len(texts)} vectors to index")
     
     def search(self, query: str, k: int = 5, filter_dict: Dict = None, 
-               file_id: int = None, namespace: str = "default") -> List[Tuple[str, float, Dict]]:
+               file_id: int = None, namespace: str = "default",
+               query_vector: np.ndarray = None) -> List[Tuple[str, float, Dict]]:
         """
         Search for similar vectors with document filtering
         
@@ -193,24 +786,41 @@ class EmbeddingService:
             filter_dict: Optional metadata filter (Pinecone only)
             file_id: Optional file_id to filter results
             namespace: Namespace/collection name (for Pinecone)
+            query_vector: Optional precomputed query embedding (skips re-encoding)
             
         Returns:
             List of tuples: (text, distance/score, metadata)
         """
-        import logging
-        logger = logging.getLogger(__name__)
+        # Create query embedding unless the caller already has it
+        if query_vector is None:
+            logger.debug(f"retrieval: creating query embedding for query='{query[:50]}...', top_k={k}")
+            query_vector = self.embed_query(query)
+        return self.search_vec(query_vector, k=k, filter_dict=filter_dict, file_id=file_id, namespace=namespace)
+    
+    def search_vec(self, query_vector: np.ndarray, k: int = 5, filter_dict: Dict = None,
+                   file_id: int = None, namespace: str = "default") -> List[Tuple[str, float, Dict]]:
+        """
+        Search for similar vectors using an already computed query embedding
         
-        # Create query embedding
-        logger.debug(f"retrieval: creating query embedding for query='{query[:50]}...', top_k={k}")
-        query_embedding = self.create_embeddings([query], show_progress=False)[0]
+        Args:
+            query_vector: Query embedding (see embed_query)
+            k: Number of results to return
+            filter_dict: Optional metadata filter (Pinecone only)
+            file_id: Optional file_id to filter results
+            namespace: Namespace/collection name (for Pinecone)
+            
+        Returns:
+            List of tuples: (text, distance/score, metadata)
+        """
+        query_embedding = np.asarray(query_vector, dtype='float32')
         
         if self.use_pinecone:
             # Build filter with file_id if provided
             if file_id:
                 if filter_dict:
-                    filter_dict['file_id'] = file_id
+                    filter_dict['file_id'] = {'$eq': file_id}
                 else:
-                    filter_dict = {'file_id': file_id}
+                    filter_dict = {'file_id': {'$eq': file_id}}
             
             # Search Pinecone
             results = self.pinecone_index.query(
@@ -239,30 +849,52 @@ class EmbeddingService:
                 logger.warning("retrieval: FAISS index is empty")
                 return []
             
-            k = min(k, len(self.texts))
-            distances, indices = self.faiss_index.search(
-                query_embedding.reshape(1, -1),
-                k
-            )
-            
-            results = []
-            for i, idx in enumerate(indices[0]):
-                if idx < len(self.texts):
-                    metadata = self.metadata[idx]
-                    # Filter by file_id if provided
-                    if file_id and metadata.get('file_id') != file_id:
-                        continue
-                    results.append((
-                        self.texts[idx],
-                        float(distances[0][i]),
-                        metadata
-                    ))
+            results = self._search_faiss(query_embedding[None, :], k, file_id=file_id)[0]
             
             logger.debug(f"retrieval: FAISS returned {len(results)} results for query, top_k={k}")
             return results
     
+    def _search_faiss(self, query_embeddings: np.ndarray, k: int,
+                      file_id: int = None) -> List[List[Tuple[str, float, Dict]]]:
+        """
+        Run one batched FAISS search for a (num_queries, dim) matrix of query embeddings
+        
+        Args:
+            query_embeddings: Query embedding matrix
+            k: Number of results per query
+            file_id: Optional file_id to restrict the search to
+            
+        Returns:
+            One list of (text, distance, metadata) tuples per query
+        """
+        with self._index_lock:
+            if file_id:
+                # Restrict the search to this file's rows inside FAISS so k is already scoped
+                selector = self._file_selector(file_id)
+                if selector is None:
+                    return [[] for _ in range(len(query_embeddings))]
+                k = min(k, len(self._file_id_to_indices[file_id]))
+                params = self._search_params(selector)
+                distances, indices = self.faiss_index.search(query_embeddings, k, params=params)
+            else:
+                k = min(k, len(self.texts))
+                distances, indices = self._get_search_index().search(query_embeddings, k)
+            
+            all_results = []
+            for row_scores, row_indices in zip(distances, indices):
+                results = []
+                for score, idx in zip(row_scores, row_indices):
+                    if 0 <= idx < len(self.texts):
+                        results.append((
+                            self.texts[idx],
+                            1.0 - float(score),  # Convert cosine similarity to distance, as for Pinecone
+                            self.metadata[idx]
+                        ))
+                all_results.append(results)
+            return all_results
+    
     def retrieve_context(self, file_id: int, query: str = None, top_k: int = 6, 
-                        namespace: str = "default") -> List[Dict]:
+                        namespace: str = "default", query_vector: np.ndarray = None) -> List[Dict]:
         """
         Retrieve context segments for RAG
         
@@ -271,37 +903,133 @@ class EmbeddingService:
             query: Optional query for semantic search
             top_k: Number of segments to return
             namespace: Namespace for vector store
+            query_vector: Optional precomputed embedding of query (see embed_query)
             
         Returns:
             List of segment dictionaries with text and metadata
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
         if query:
             # Semantic search with query
             logger.debug(f"retrieval: semantic search for file_id={file_id}, query='{query[:50]}...', top_k={top_k}")
-            search_results = self.search(
-                query=query,
+            if query_vector is None:
+                query_vector = self.embed_query(query)
+            search_results = self.search_vec(
+                query_vector,
                 k=top_k,
                 file_id=file_id,
                 namespace=namespace
             )
         else:
-            # Retrieve top segments for document (by similarity to document summary)
-            # For simplicity, we'll do a generic search or fetch by metadata
             logger.debug(f"retrieval: fetching top {top_k} segments for file_id={file_id}")
-            # Use a generic query to get document segments
-            search_results = self.search(
-                query="document content",
-                k=top_k * 2,  # Get more to filter
-                file_id=file_id,
-                namespace=namespace
-            )
-            # Take top_k
-            search_results = search_results[:top_k]
+            if self.use_pinecone:
+                # Pinecone has no local metadata - use a generic query to get document segments
+                search_results = self.search_vec(
+                    self._generic_probe_embedding,
+                    k=top_k * 2,  # Get more to filter
+                    file_id=file_id,
+                    namespace=namespace
+                )
+                # Take top_k
+                search_results = search_results[:top_k]
+            else:
+                # No query to rank by - take the document's first segments straight
+                # from metadata instead of embedding a generic probe query
+                with self._index_lock:
+                    search_results = [
+                        (self.texts[idx], 0.0, self.metadata[idx])
+                        for idx in self._file_id_to_indices.get(file_id, [])[:top_k]
+                    ]
+        
+        segments = self._format_segments(search_results, file_id)
+        
+        logger.info(f"retrieval: returned {len(segments)} segments for file_id={file_id}")
+        return segments
+    
+    def batch_search(self, queries: List[str], k: int = 5, file_id: int = None,
+                     namespace: str = "default") -> List[List[Tuple[str, float, Dict]]]:
+        """
+        Search for several queries at once
+        
+        All queries are encoded in one forward pass and, for FAISS, searched with
+        a single index.search call.
+        
+        Args:
+            queries: Query texts
+            k: Number of results per query
+            file_id: Optional file ID to restrict results to
+            namespace: Namespace (for Pinecone)
+            
+        Returns:
+            One list of (text, distance, metadata) tuples per query, in query order
+        """
+        if not queries:
+            return []
+        
+        query_embeddings = self.embed_queries(queries)
+        
+        if self.use_pinecone:
+            # Pinecone queries one vector per request; the encoding is still shared
+            return [
+                self.search_vec(vec, k=k, file_id=file_id, namespace=namespace)
+                for vec in query_embeddings
+            ]
+        
+        if len(self.texts) == 0:
+            logger.warning("retrieval: FAISS index is empty")
+            return [[] for _ in queries]
+        
+        results = self._search_faiss(query_embeddings, k, file_id=file_id)
+        logger.debug(f"retrieval: FAISS batch search for {len(queries)} queries, top_k={k}")
+        return results
+    
+    def retrieve_context_multi(self, file_id: int, queries: List[str], top_k_per_query: int = 3,
+                               top_k: int = 6, namespace: str = "default") -> List[Dict]:
+        """
+        Retrieve context segments for several queries at once, for coverage across sub-topics
         
-        # Format results as segments
+        Queries go through batch_search. Results are interleaved by rank (in query order) so each
+        query contributes, and duplicate segments keep their best score.
+        
+        Args:
+            file_id: Document ID to retrieve from
+            queries: Queries for semantic search
+            top_k_per_query: Number of segments to fetch per query
+            top_k: Maximum number of segments to return in total
+            namespace: Namespace for vector store
+            
+        Returns:
+            List of segment dictionaries with text and metadata
+        """
+        queries = [q for q in dict.fromkeys(queries) if q]
+        if not queries:
+            return self.retrieve_context(file_id=file_id, top_k=top_k, namespace=namespace)
+        
+        logger.debug(f"retrieval: multi-query search for file_id={file_id}, num_queries={len(queries)}, top_k_per_query={top_k_per_query}")
+        
+        per_query_results = self.batch_search(queries, k=top_k_per_query, file_id=file_id, namespace=namespace)
+        
+        # Dedupe by segment, keeping the earliest position (rank, then query order)
+        # and the best (lowest) distance seen for it
+        best = {}
+        for query_idx, results in enumerate(per_query_results):
+            for rank, (text, score, metadata) in enumerate(results):
+                key = (metadata.get('file_id'), metadata.get('segment_id'), text)
+                if key in best:
+                    position, best_score, _, _ = best[key]
+                    best[key] = (min(position, (rank, query_idx)), min(score, best_score), text, metadata)
+                else:
+                    best[key] = ((rank, query_idx), score, text, metadata)
+        
+        ordered = sorted(best.values(), key=lambda item: item[0])
+        search_results = [(text, score, metadata) for _, score, text, metadata in ordered[:top_k]]
+        segments = self._format_segments(search_results, file_id)
+        
+        logger.info(f"retrieval: multi-query returned {len(segments)} segments for file_id={file_id}")
+        return segments
+    
+    @staticmethod
+    def _format_segments(search_results: List[Tuple[str, float, Dict]], file_id: int) -> List[Dict]:
+        """Format search results as segment dictionaries"""
         segments = []
         for text, score, metadata in search_results:
             segments.append({
@@ -312,21 +1040,64 @@ class EmbeddingService:
                 'topic': metadata.get('topic', ''),
                 'chunk_index': metadata.get('chunk_index', 0)
             })
-        
-        logger.info(f"retrieval: returned {len(segments)} segments for file_id={file_id}")
         return segments
     
     def save_faiss_index(self):
         """Save FAISS index to disk"""
         if not self.use_pinecone and self.faiss_index:
             os.makedirs(config.OUTPUT_DIR, exist_ok=True)
-            try:
-                faiss.write_index(self.faiss_index, self.index_path)
-                with open(self.metadata_path, 'wb') as f:
-                    pickle.dump({
-                        'texts': self.texts,
-                        'metadata': self.metadata
-                    }, f)
-            except Exception as e:
-                print(f"⚠️ Error saving FAISS index: {e}")
+            with self._index_lock:
+                try:
+                    # Write to temp files and swap them in so a crash never leaves a half-written index
+                    tmp_index_path = self.index_path + ".tmp"
+                    faiss.write_index(self.faiss_index, tmp_index_path)
+                    if pa is not None:
+                        tmp_segments_path = self.segments_path + ".tmp"
+                        pq.write_table(self._segments_table(), tmp_segments_path)
+                        # Segments first: the loader refuses an index whose row count doesn't match them
+                        os.replace(tmp_segments_path, self.segments_path)
+                        os.replace(tmp_index_path, self.index_path)
+                        for path in (self.metadata_path, self.texts_path, self.text_offsets_path):
+                            if os.path.exists(path):
+                                os.remove(path)  # this service's superseded pickle-based files
+                    else:
+                        tmp_metadata_path = self.metadata_path + ".tmp"
+                        tmp_texts_path = self.texts_path + ".tmp"
+                        tmp_offsets_path = self.text_offsets_path + ".tmp"
+                        _write_text_blob(self.texts, tmp_texts_path, tmp_offsets_path)
+                        with open(tmp_metadata_path, 'wb') as f:
+                            pickle.dump({'metadata': self.metadata}, f)
+                        os.replace(tmp_texts_path, self.texts_path)
+                        os.replace(tmp_offsets_path, self.text_offsets_path)
+                        os.replace(tmp_metadata_path, self.metadata_path)
+                        os.replace(tmp_index_path, self.index_path)
+                    self._dirty = False
+                    self._last_save_ntotal = self.faiss_index.ntotal
+                except Exception as e:
+                    print(f"⚠️ Error saving FAISS index: {e}")
+    
+    def _segments_table(self):
+        """
+        Build the columnar segment table written next to the FAISS index
+        
+        Returns:
+            Arrow table with one row per vector: text, file_id and the JSON-encoded metadata
+        """
+        n = len(self.texts)
+        file_ids = np.zeros(n, dtype=np.int64)
+        has_file_id = np.zeros(n, dtype=bool)
+        for file_id, indices in self._file_id_to_indices.items():
+            file_ids[indices] = file_id
+            has_file_id[indices] = True
+        return pa.table({
+            'text': _string_column(self.texts),
+            'file_id': pa.array(file_ids, mask=~has_file_id),
+            'metadata': _string_column(self.metadata, encode=_encode_metadata),
+        })
+    
+    def flush(self):
+        """Write the FAISS index to disk if it has unsaved vectors"""
+        with self._index_lock:
+            if self._dirty:
+                self.save_faiss_index()
 
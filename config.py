@@ -55,6 +55,27 @@ DEEPSEEK_MODEL = "DeepSeek-R1-distill-LLaMA"  # Default DeepSeek model (R1 disti
 # Embedding Configuration
 EMBEDDING_MODEL = "BAAI/bge-large-en-v1.5"  # bge-large for FAISS embeddings
 EMBEDDING_DIMENSION = 1024  # bge-large dimension
+EMBEDDING_BATCH_SIZE = 64  # Texts per encode batch
+# Inference backend: "torch", "onnx" (needs optimum[onnxruntime]) or "openvino" (needs optimum[openvino])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+# Inference precision: "float32", "float16" (GPU, torch backend) or "int8" (dynamic quantization, onnx backend)
+EMBEDDING_DTYPE = os.getenv("EMBEDDING_DTYPE", "float32").lower()
+# CPU threads for model inference (torch) and FAISS search; defaults to one per physical core
+NUM_THREADS = int(os.getenv("NUM_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+# Worker processes for bulk CPU encoding (process_pdf); each loads its own copy of the model
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", "2"))
+
+# FAISS Index Configuration
+FAISS_IVF_THRESHOLD = 10000  # Switch from exact flat search to OPQ + IVF-PQ at this many vectors
+FAISS_NPROBE = 16  # Inverted lists scanned per query once on IVF-PQ
+# Vector storage of the flat index: "int8" (1 byte per dim) or "fp16" (2 bytes per dim)
+FAISS_FLAT_STORAGE = os.getenv("FAISS_FLAT_STORAGE", "int8").lower()
+FAISS_SAVE_EVERY = 500  # Snapshot the index to disk after this many new vectors; newer ones are lost on a crash until flush()
+FAISS_USE_GPU = os.getenv("FAISS_USE_GPU", "True").lower() == "true"  # Used only if FAISS has GPU support
+
+# Pinecone Configuration (only when EmbeddingService(use_pinecone=True))
+PINECONE_UPSERT_BATCH = 100  # Vectors per upsert request
+PINECONE_POOL_THREADS = 8  # Upsert requests in flight at once
 
 # File Paths
 OUTPUT_DIR = "outputs"
@@ -14,7 +14,7 @@ sys.path.append(str(Path(__file__).parent.parent))
 from api.database import Database
 from api.services.embedding_service import EmbeddingService
 from utils.llm_utils import call_llm, parse_json_response
-from utils.prompts import FLASHCARD_PROMPT, QUIZ_PROMPT, PLANNER_PROMPT
+from utils.prompts import build_flashcard_prompt, QUIZ_PROMPT, PLANNER_PROMPT
 from datetime import datetime
 import config
 
@@ -35,10 +35,7 @@ def generate_flashcards(file_id: int, num_flashcards: int = 10, temperature: flo
     context = "\n\n".join(context_texts)
     
     # Generate
-    prompt = FLASHCARD_PROMPT.format(
-        text=context[:4000],
-        num_flashcards=num_flashcards
-    )
+    prompt = build_flashcard_prompt(context[:4000], num_flashcards)
     prompt += "\n\nIMPORTANT: Keep answers SHORT (1-2 sentences max)."
     
     print(f"🤖 Generating {num_flashcards} flashcards...")
@@ -5,15 +5,16 @@ Standalone script to process a PDF through the complete pipeline
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from api.database import Database, init_db
-from utils.pdf_utils import extract_text_from_pdf, clean_text
+from utils.pdf_utils import iter_pdf_pages, clean_pages, file_sha256
 from api.services.chunking_service import ChunkingService
-from api.services.embedding_service import EmbeddingService
+from api.services.embedding_service import EmbeddingService, SegmentMeta
 import config
 
 
@@ -36,75 +37,91 @@ def process_pdf(pdf_path: str, file_name: str = None):
     
     # Initialize services
     init_db()
-    db = Database()
     chunking_service = ChunkingService()
-    embedding_service = EmbeddingService()
     
-    # Extract file name
-    if not file_name:
-        file_name = os.path.basename(pdf_path)
-    
-    # Step 1: Extract text
-    print(f"\n📄 Step 1: Extracting text from {file_name}...")
-    raw_text = extract_text_from_pdf(pdf_path)
-    print(f"   ✅ Extracted {len(raw_text)} characters")
-    
-    # Step 2: Clean text
-    print(f"\n🧹 Step 2: Cleaning text...")
-    cleaned_text = clean_text(raw_text)
-    print(f"   ✅ Cleaned text: {len(cleaned_text)} characters")
-    
-    # Step 3: Store file in database
-    print(f"\n💾 Step 3: Storing file in database...")
-    file_size = os.path.getsize(pdf_path)
-    file_id = db.add_file(
-        file_name=file_name,
-        file_path=pdf_path,
-        file_size=file_size,
-        file_type="pdf",
-        raw_text=cleaned_text
-    )
-    print(f"   ✅ File stored with ID: {file_id}")
-    
-    # Step 4: Chunk text
-    print(f"\n✂️ Step 4: Chunking text into segments...")
-    segments = chunking_service.chunk_text(cleaned_text, file_id=file_id)
-    print(f"   ✅ Created {len(segments)} segments")
-    
-    # Step 5: Store segments
-    print(f"\n💾 Step 5: Storing segments in database...")
-    db.add_segments(file_id, segments)
-    print(f"   ✅ Segments stored")
-    
-    # Step 6: Create embeddings
-    print(f"\n🔢 Step 6: Creating embeddings...")
-    segment_texts = [seg['text_content'] for seg in segments]
-    segment_metadata = [
-        {
-            'file_id': file_id,
-            'segment_id': seg['chunk_index'],
-            'topic': seg['topic'],
-            'label': seg['label']
-        }
-        for seg in segments
-    ]
-    embedding_ids = [f"file_{file_id}_seg_{seg['chunk_index']}" for seg in segments]
-    
-    embedding_service.add_vectors(
-        texts=segment_texts,
-        metadata=segment_metadata,
-        embedding_ids=embedding_ids
-    )
-    print(f"   ✅ Embeddings created and stored")
-    
-    print("\n" + "=" * 60)
-    print("✅ Processing Complete!")
-    print("=" * 60)
-    print(f"File ID: {file_id}")
-    print(f"Segments: {len(segments)}")
-    print(f"Database: {config.DB_PATH}")
-    
-    return file_id, segments
+    # One connection with batch pragmas for all database steps. The executor is exited
+    # first, so background writes finish before the connection closes, even on errors
+    with Database() as db, ThreadPoolExecutor(max_workers=2) as background:
+        # Load the embedding model and index in the background while the PDF is extracted and chunked
+        embedding_future = background.submit(EmbeddingService)
+        
+        # Extract file name
+        if not file_name:
+            file_name = os.path.basename(pdf_path)
+        
+        # Steps 1-2 only depend on the file's bytes; reuse the result for an identical PDF
+        cache_path = os.path.join(config.OUTPUT_DIR, "text_cache", f"{file_sha256(pdf_path)}.txt")
+        if os.path.exists(cache_path):
+            print(f"\n📄 Steps 1-2: Using cached text for {file_name}...")
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cleaned_text = f.read()
+            print(f"   ✅ Cleaned text: {len(cleaned_text)} characters")
+        else:
+            # Steps 1-2: Extract and clean page by page, so the raw text is never held in full
+            print(f"\n📄 Steps 1-2: Extracting and cleaning text from {file_name}...")
+            cleaned_text = '\n\n'.join(clean_pages(iter_pdf_pages(pdf_path, parallel=True)))
+            print(f"   ✅ Cleaned text: {len(cleaned_text)} characters")
+            
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(cleaned_text)
+        
+        # Step 3: Store file in database
+        print(f"\n💾 Step 3: Storing file in database...")
+        file_size = os.path.getsize(pdf_path)
+        file_id = db.add_file(
+            file_name=file_name,
+            file_path=pdf_path,
+            file_size=file_size,
+            file_type="pdf",
+            raw_text=cleaned_text
+        )
+        print(f"   ✅ File stored with ID: {file_id}")
+        
+        # Step 4: Chunk text, collecting the embedding inputs in the same pass
+        print(f"\n✂️ Step 4: Chunking text into segments...")
+        segments, segment_texts, segment_metadata, embedding_ids = [], [], [], []
+        id_prefix = f"file_{file_id}_seg_"
+        for seg in chunking_service.iter_chunks(cleaned_text, file_id=file_id):
+            segments.append(seg)
+            chunk_index = seg['chunk_index']
+            segment_texts.append(seg['text_content'])
+            segment_metadata.append(SegmentMeta(
+                file_id=file_id,
+                segment_id=chunk_index,
+                topic=seg['topic'],
+                label=seg['label'],
+                chunk_index=chunk_index
+            ))
+            embedding_ids.append(id_prefix + str(chunk_index))
+        print(f"   ✅ Created {len(segments)} segments")
+        
+        # Step 5: Store segments (in the background, alongside embedding; both only read segments)
+        print(f"\n💾 Step 5: Storing segments in database...")
+        segments_future = background.submit(db.add_segments, file_id, segments)
+        
+        # Step 6: Create embeddings
+        print(f"\n🔢 Step 6: Creating embeddings...")
+        embedding_service = embedding_future.result()
+        embedding_service.add_vectors(
+            texts=segment_texts,
+            metadata=segment_metadata,
+            embedding_ids=embedding_ids,
+            parallel=True
+        )
+        embedding_service.flush()
+        print(f"   ✅ Embeddings created and stored")
+        segments_future.result()
+        print(f"   ✅ Segments stored")
+        
+        print("\n" + "=" * 60)
+        print("✅ Processing Complete!")
+        print("=" * 60)
+        print(f"File ID: {file_id}")
+        print(f"Segments: {len(segments)}")
+        print(f"Database: {config.DB_PATH}")
+        
+        return file_id, segments
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 """Setup script for the Study Assistant"""
 import os
+import shutil
 import subprocess
 import sys
 
@@ -18,9 +19,7 @@ def check_env_file():
     if not os.path.exists('.env'):
         if os.path.exists('env.example'):
             print("⚠️  .env file not found. Creating from env.example...")
-            with open('env.example', 'r') as src:
-                with open('.env', 'w') as dst:
-                    dst.write(src.read())
+            shutil.copyfile('env.example', '.env')
             print("✅ Created .env file. Please add your OpenAI API key!")
         else:
             print("⚠️  .env file not found. Please create one with your OpenAI API key.")
@@ -30,8 +29,16 @@ def check_env_file():
 def install_requirements():
     """Install required packages"""
     print("\n📦 Installing requirements...")
+    pip_install = [sys.executable, "-m", "pip", "install", "--prefer-binary"]
+    # Skip byte-compiling every installed module; Python compiles on first import anyway
+    env = dict(os.environ, PIP_NO_COMPILE="1")
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        try:
+            # Wheels only: never fall into multi-minute source builds (torch, faiss, ...)
+            subprocess.check_call(pip_install + ["--only-binary=:all:", "-r", "requirements.txt"], env=env)
+        except subprocess.CalledProcessError:
+            print("⚠️  Some packages have no wheel for this platform. Retrying with source builds allowed...")
+            subprocess.check_call(pip_install + ["-r", "requirements.txt"], env=env)
         print("✅ Requirements installed successfully!")
     except subprocess.CalledProcessError:
         print("❌ Error installing requirements. Please run: pip install -r requirements.txt")
@@ -16,11 +16,11 @@ from utils.pdf_utils import extract_text_from_pdf, clean_text
 from api.services.chunking_service import ChunkingService
 from api.services.embedding_service import EmbeddingService
 from utils.llm_utils import call_llm, parse_json_response
-from utils.prompts import FLASHCARD_PROMPT
+from utils.prompts import build_flashcard_prompt
 import config
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_db():
     """Create a temporary database for testing"""
     # Use temporary database
@@ -30,9 +30,8 @@ def test_db():
     
     # Initialize
     init_db()
-    db = Database(db_path=test_db_path)
-    
-    yield db
+    with Database(db_path=test_db_path) as db:
+        yield db
     
     # Cleanup
     if os.path.exists(test_db_path):
@@ -40,6 +39,18 @@ def test_db():
     config.DB_PATH = original_db_path
 
 
+@pytest.fixture(scope="session")
+def chunking_service():
+    """Chunking service with the default configuration"""
+    return ChunkingService()
+
+
+@pytest.fixture(scope="session")
+def embedding_service():
+    """Embedding service shared by all tests (loads the model once)"""
+    return EmbeddingService()
+
+
 @pytest.fixture
 def sample_text():
     """Sample text for testing"""
@@ -64,7 +75,7 @@ def sample_text():
     """
 
 
-def test_pipeline_end_to_end(test_db, sample_text):
+def test_pipeline_end_to_end(test_db, sample_text, chunking_service, embedding_service):
     """
     End-to-end test of the complete pipeline:
     1. Store file
@@ -91,7 +102,6 @@ def test_pipeline_end_to_end(test_db, sample_text):
     
     # Step 2: Chunk text
     print("\n✂️ Step 2: Chunking text...")
-    chunking_service = ChunkingService()
     segments = chunking_service.chunk_text(sample_text, file_id=file_id)
     assert len(segments) > 0
     print(f"   ✅ Created {len(segments)} segments")
@@ -105,7 +115,6 @@ def test_pipeline_end_to_end(test_db, sample_text):
     
     # Step 4: Create embeddings
     print("\n🔢 Step 4: Creating embeddings...")
-    embedding_service = EmbeddingService()
     segment_texts = [seg['text_content'] for seg in segments]
     segment_metadata = [
         {
@@ -128,6 +137,9 @@ def test_pipeline_end_to_end(test_db, sample_text):
     print("\n🔍 Step 5: Testing semantic search...")
     search_results = embedding_service.search("machine learning", k=3)
     assert len(search_results) > 0
+    batch_results = embedding_service.batch_search(["machine learning", "neural networks"], k=3)
+    assert len(batch_results) == 2
+    assert batch_results[0] == search_results
     print(f"   ✅ Found {len(search_results)} relevant results")
     
     # Step 6: Generate flashcards (if API key available)
@@ -137,10 +149,7 @@ def test_pipeline_end_to_end(test_db, sample_text):
         context = "\n\n".join(segment_texts[:3])
         
         # Generate (with low temperature for determinism)
-        prompt = FLASHCARD_PROMPT.format(
-            text=context[:2000],
-            num_flashcards=3
-        )
+        prompt = build_flashcard_prompt(context[:2000], num_flashcards=3)
         prompt += "\n\nIMPORTANT: Keep answers SHORT (1-2 sentences max)."
         
         response = call_llm(prompt, provider="gemini", temperature=0.3)
@@ -179,23 +188,26 @@ def test_pipeline_end_to_end(test_db, sample_text):
     print("=" * 60)
 
 
-def test_chunking_service():
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(100, 20), (200, 50), (300, 30)])
+def test_chunking_service(chunk_size, chunk_overlap):
     """Test chunking service"""
-    service = ChunkingService(chunk_size=100, chunk_overlap=20)
+    service = ChunkingService(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     text = "This is a test. " * 50  # Create long text
     segments = service.chunk_text(text)
     
     assert len(segments) > 0
     assert all('text_content' in seg for seg in segments)
     assert all('chunk_index' in seg for seg in segments)
+    # Offsets point at the chunk's exact position in the source text
+    assert all(text[seg['start_char']:seg['end_char']] == seg['text_content'] for seg in segments)
+    # The streaming variant yields the same segments
+    assert list(service.iter_chunks(text)) == segments
 
 
-def test_embedding_service():
+def test_embedding_service(embedding_service):
     """Test embedding service"""
-    service = EmbeddingService()
-    
     texts = ["Machine learning is great", "AI is the future"]
-    embeddings = service.create_embeddings(texts)
+    embeddings = embedding_service.create_embeddings(texts)
     
     assert embeddings.shape[0] == 2
     assert embeddings.shape[1] > 0
@@ -1,22 +1,26 @@
 """Streamlit UI for the Study Assistant"""
 import streamlit as st
+import asyncio
+import html
+import importlib
 import json
 import os
-import glob
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import sys
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.reader import ReaderAgent
-from agents.flashcard import FlashcardAgent
-from agents.quiz import QuizAgent
-from agents.planner import PlannerAgent
-from agents.chat import ChatAgent
 from utils.database import StudyDatabase
 import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Page configuration
 st.set_page_config(
     page_title="AI Study Assistant",
@@ -25,33 +29,368 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Initialize session state
-if 'reader_agent' not in st.session_state:
-    st.session_state.reader_agent = ReaderAgent()
-if 'flashcard_agent' not in st.session_state:
-    st.session_state.flashcard_agent = FlashcardAgent()
-if 'quiz_agent' not in st.session_state:
-    st.session_state.quiz_agent = QuizAgent()
-if 'planner_agent' not in st.session_state:
-    st.session_state.planner_agent = PlannerAgent()
-if 'chat_agent' not in st.session_state:
-    st.session_state.chat_agent = ChatAgent()
-if 'processed_content' not in st.session_state:
-    st.session_state.processed_content = None
-if 'flashcards' not in st.session_state:
-    st.session_state.flashcards = []
-if 'quizzes' not in st.session_state:
-    st.session_state.quizzes = []
-if 'revision_plan' not in st.session_state:
-    st.session_state.revision_plan = {}
-if 'quiz_answers' not in st.session_state:
-    st.session_state.quiz_answers = {}
-if 'quiz_results' not in st.session_state:
-    st.session_state.quiz_results = {}
-if 'current_file_id' not in st.session_state:
-    st.session_state.current_file_id = None
-if 'db' not in st.session_state:
-    st.session_state.db = StudyDatabase()
+
+# Agents are created once per server process and shared by all sessions (the reader's
+# memory module is shared state; it locks its own writes).
+# Agent modules (LLM SDKs, embedding model) are imported on first use, not at startup.
+@st.cache_resource
+def get_reader_agent():
+    from agents.reader import ReaderAgent
+    return ReaderAgent()
+
+
+@st.cache_resource
+def get_flashcard_agent():
+    from agents.flashcard import FlashcardAgent
+    return FlashcardAgent()
+
+
+@st.cache_resource
+def get_quiz_agent():
+    from agents.quiz import QuizAgent
+    return QuizAgent()
+
+
+@st.cache_resource
+def get_planner_agent():
+    from agents.planner import PlannerAgent
+    return PlannerAgent()
+
+
+@st.cache_resource
+def get_study_database() -> StudyDatabase:
+    """Shared database handle (it opens a connection per call, so sessions can share it)"""
+    return StudyDatabase()
+
+
+# Concurrent background generation jobs (across all sessions)
+GENERATION_WORKERS = 4
+
+
+@st.cache_resource
+def get_job_executor() -> ThreadPoolExecutor:
+    """Worker threads for long LLM jobs, so a generation does not hold the page script"""
+    return ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+
+
+@st.cache_resource
+def get_io_executor() -> ThreadPoolExecutor:
+    """Worker threads for database writes the page does not need to wait for"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="db-write")
+
+
+def record_processed_file(file_name: str, file_path: str, file_size: int, topics: list, file_hash: str):
+    """Save a processed file and its topics in the background; get_current_file_id waits for its ID"""
+    st.session_state.current_file_id = get_io_executor().submit(
+        get_study_database().add_file_with_topics,
+        file_name,
+        file_path,
+        file_size,
+        topics,
+        file_hash=file_hash
+    )
+
+
+def get_current_file_id():
+    """Database ID of the processed file, waiting for its background write if that is still running"""
+    file_id = st.session_state.current_file_id
+    if isinstance(file_id, Future):
+        try:
+            file_id = file_id.result()
+        except Exception as e:
+            # Generated material is still usable, just not linked to a file
+            print(f"Error saving file to database: {e}")
+            file_id = None
+        st.session_state.current_file_id = file_id
+    return file_id
+
+
+def generate_flashcards_job(agent, chunks: list, file_id, partial: list) -> list:
+    """
+    Generate and save flashcards (runs on a worker thread, so it must not call st.*).
+    
+    Args:
+        agent: Flashcard agent
+        chunks: Text chunks to generate from
+        file_id: Database file ID to save the flashcards under
+        partial: Receives each chunk's flashcards as they arrive, for the page to show meanwhile
+        
+    Returns:
+        All generated flashcards
+    """
+    flashcards = asyncio.run(agent.generate_from_chunks_async(
+        chunks, max_chunks=5, concurrency=5, streaming_callback=partial.extend
+    ))
+    if flashcards:
+        agent.save_flashcards(flashcards, file_id)
+    return flashcards
+
+
+def get_chat_agent():
+    """This session's chat agent (conversation history is per session; the embedding model is shared)"""
+    if 'chat_agent' not in st.session_state:
+        from agents.chat import ChatAgent
+        st.session_state.chat_agent = ChatAgent(memory=get_reader_agent().memory, db=get_study_database())
+    return st.session_state.chat_agent
+
+
+@st.cache_resource(show_spinner=False, max_entries=16, ttl=3600)
+def process_pdf_cached(_pdf_data, file_hash: str, file_name: str, file_path: str = None, topics: list = None) -> dict:
+    """
+    Run the reader agent once per distinct upload (keyed by content hash and name)
+    
+    The result (text and chunk list) is one shared object for every session
+    that processes the same file, not a per-call copy; treat it as read-only.
+    _pdf_data (bytes or a memoryview) is left out of the cache key, so the
+    file is not re-hashed on every call; it is only needed when file_path is
+    None, to save the upload. Pass file_path for a PDF already saved in the
+    upload directory, and topics if they were already identified for it.
+    """
+    content = get_reader_agent().process_bytes(_pdf_data, file_name, file_path=file_path, topics=topics)
+    content['file_hash'] = file_hash  # keys the per-document caches below
+    return content
+
+
+def file_sha256(file_path: str, block_size: int = 65536) -> str:
+    """SHA-256 of a file's contents, read in blocks rather than all at once"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def process_upload(uploaded_file) -> dict:
+    """
+    Process an uploaded PDF and record it in the database.
+    
+    A file whose contents were uploaded before (same SHA-256) reuses its saved
+    copy, database row and topics: nothing is written and no topic LLM call is made.
+    
+    Args:
+        uploaded_file: Streamlit uploaded file object
+        
+    Returns:
+        Processed content (also stored in session state with the file's ID)
+    """
+    # A view of the upload's in-memory buffer; getvalue() would copy the whole file
+    pdf_data = uploaded_file.getbuffer()
+    file_hash = hashlib.sha256(pdf_data).hexdigest()
+    db = get_study_database()
+    
+    existing = db.get_file_by_hash(file_hash)
+    if existing and os.path.exists(existing['file_path']):
+        content = process_pdf_cached(
+            pdf_data,
+            file_hash,
+            uploaded_file.name,
+            file_path=existing['file_path'],
+            topics=db.get_topics(existing['id']) or None
+        )
+        st.session_state.current_file_id = existing['id']
+    else:
+        content = process_pdf_cached(pdf_data, file_hash, uploaded_file.name)
+        record_processed_file(
+            uploaded_file.name,
+            content['file_path'],
+            uploaded_file.size,
+            content.get('topics', []),
+            file_hash
+        )
+        list_saved_pdfs.clear()  # the upload was just saved to UPLOAD_DIR
+    
+    st.session_state.processed_content = content
+    return content
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def list_saved_pdfs(upload_dir: str) -> list:
+    """
+    List the PDFs in upload_dir, newest first.
+    
+    Cached briefly so widget interactions do not re-stat the whole directory.
+    
+    Args:
+        upload_dir: Directory holding uploaded files
+        
+    Returns:
+        List of (path, file name, size in bytes, mtime) tuples
+    """
+    if not os.path.isdir(upload_dir):
+        return []
+    pdfs = []
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith('.pdf'):
+                stat = entry.stat()
+                pdfs.append((entry.path, entry.name, stat.st_size, stat.st_mtime))
+    pdfs.sort(key=lambda pdf: pdf[3], reverse=True)
+    return pdfs
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def get_gemini_api_key() -> str:
+    """Configured Gemini API key, read once instead of on every rerun"""
+    return config.GEMINI_API_KEY or os.getenv("GEMINI_API_KEY", "")
+
+
+@st.cache_resource(show_spinner=False, max_entries=16, ttl=3600)
+def get_chat_index(file_hash: str, _chunks: list):
+    """Embeddings of a processed document's chunks, built on the first question about it (shared by all sessions)"""
+    # Every session's chat agent searches with the reader's memory module, so one index serves them all
+    return get_reader_agent().memory.embed_chunks(_chunks)
+
+
+@st.cache_data(show_spinner=False, max_entries=256, ttl=3600)
+def find_context_cached(question: str, file_hash: str, _chunks: list) -> str:
+    """Semantic-search context for a question about a document, so asking it again skips the search"""
+    # Errors propagate (and are not cached) so the caller can fall back per request
+    memory = get_reader_agent().memory
+    return "\n\n".join(memory.top_chunks(question, _chunks, get_chat_index(file_hash, _chunks), k=3))
+
+
+def find_chat_context(chat_agent, question: str, file_hash: str, chunks: list) -> str:
+    """Relevant context for a question: cached semantic search, else this session's keyword fallback"""
+    try:
+        context = find_context_cached(question, file_hash, chunks)
+        if context:
+            return context
+    except Exception as e:
+        print(f"Error in semantic search, falling back to keyword matching: {e}")
+    return chat_agent.keyword_context(question, chunks)
+
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def create_plan_cached(file_hash: str, start_date: str, _topics: list) -> dict:
+    """Revision plan for a document's topics, created once per document per day"""
+    return get_planner_agent().create_revision_plan(_topics)
+
+
+def json_download(name: str, obj) -> bytes:
+    """
+    Indented JSON for a download button, encoded again only when obj is replaced
+    
+    Args:
+        name: Cache slot (one per download button)
+        obj: Session object to serialize (flashcards, quiz, plan)
+        
+    Returns:
+        UTF-8 encoded JSON
+    """
+    cache = st.session_state.setdefault('json_downloads', {})
+    cached = cache.get(name)
+    if cached is None or cached[0] is not obj:
+        if orjson is not None:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            data = json.dumps(obj, indent=2).encode('utf-8')
+        cached = cache[name] = (obj, data)
+    return cached[1]
+
+
+def generation_error_markdown(error: Exception, artifact: str, provider: str, key_name: str) -> str:
+    """
+    Message, checklist and technical details for a failed generation, as one markdown block
+    
+    Args:
+        error: The exception raised
+        artifact: What was being generated ("flashcards", "quizzes")
+        provider: LLM provider used for it
+        key_name: Name of the provider's API key setting
+        
+    Returns:
+        Markdown for a single st.error
+    """
+    error_msg = str(error)
+    lines = [
+        f"❌ Error generating {artifact}: {error_msg}",
+        "",
+        "💡 Please check:",
+        f"- Your {provider} API key is configured correctly (for {artifact})",
+        "- You have internet connection",
+        "- Try again with a smaller PDF"
+    ]
+    if provider.lower() in error_msg.lower():
+        lines += ["", f"⚠️ {artifact.capitalize()} generation uses {provider} API. Make sure {key_name} is set!"]
+    lines += ["", "🔍 Technical Details:", "```", error_msg, "```"]
+    return "\n".join(lines)
+
+
+# Characters of extracted text shown in the upload preview (the rest is offered as a download)
+TEXT_PREVIEW_CHARS = 5000
+
+# Sticky note style card for the "All Cards" grid (kept on one line so markdown leaves it as HTML)
+FLASHCARD_NOTE_HTML = (
+    '<div><div style="background: linear-gradient(135deg, #ffd89b 0%, #ffecd2 100%); padding: 15px; '
+    'border-radius: 8px; border-left: 4px solid #ff6b6b; margin-bottom: 15px; '
+    'box-shadow: 0 2px 4px rgba(0,0,0,0.1); min-height: 120px;">'
+    '<h4 style="color: #333; margin-top: 0;">📌 {question}</h4>'
+    '<p style="color: #555; font-size: 0.95em; margin-bottom: 0;">{answer}</p></div>{topic}</div>'
+)
+FLASHCARD_TOPIC_HTML = '<p style="color: #808495; font-size: 0.875em; margin: -10px 0 15px;">🏷️ {topic}</p>'
+
+
+def render_flashcard_grid(flashcards: list) -> str:
+    """Build the HTML for all flashcards as a two-column grid (card text is escaped)"""
+    parts = ['<div style="display: grid; grid-template-columns: 1fr 1fr; column-gap: 15px;">']
+    for card in flashcards:
+        topic = card.get('topic')
+        parts.append(FLASHCARD_NOTE_HTML.format(
+            question=html.escape(str(card.get('question', ''))),
+            answer=html.escape(str(card.get('answer', ''))),
+            topic=FLASHCARD_TOPIC_HTML.format(topic=html.escape(str(topic))) if 'topic' in card else ''
+        ))
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def flashcard_grid_html(flashcards: list) -> str:
+    """render_flashcard_grid for the session's flashcards, rebuilt only when the list is replaced"""
+    cached = st.session_state.get('flashcard_grid')
+    if cached is None or cached[0] is not flashcards:
+        cached = st.session_state.flashcard_grid = (flashcards, render_flashcard_grid(flashcards))
+    return cached[1]
+
+
+def render_chunk_previews(chunks: list, preview_chars: int) -> str:
+    """Build the HTML for numbered chunk previews, each cut to preview_chars (chunk text is escaped)"""
+    parts = []
+    for i, chunk in enumerate(chunks, 1):
+        preview = chunk[:preview_chars] + "..." if len(chunk) > preview_chars else chunk
+        parts.append(
+            f'<p><strong>Chunk {i}</strong> ({len(chunk)} characters):</p>'
+            f'<pre style="white-space: pre-wrap;">{html.escape(preview)}</pre>'
+        )
+    return '<hr>'.join(parts)
+
+
+def render_topic_list(topics: list) -> str:
+    """Build the HTML for identified topics as collapsible blocks (topic text is escaped)"""
+    parts = []
+    for i, topic in enumerate(topics, 1):
+        parts.append(f"<details><summary>Topic {i}: {html.escape(str(topic.get('topic', 'Unknown')))}</summary>")
+        if topic.get('subtopics'):
+            parts.append(f"<p><strong>Subtopics:</strong> {html.escape(', '.join(topic['subtopics'][:5]))}</p>")
+        if topic.get('key_concepts'):
+            parts.append(f"<p><strong>Key Concepts:</strong> {html.escape(', '.join(topic['key_concepts'][:5]))}</p>")
+        parts.append('</details>')
+    return ''.join(parts)
+
+
+# Initialize session state once per session (fresh containers for each session)
+if 'initialized' not in st.session_state:
+    st.session_state.update({
+        'processed_content': None,
+        'flashcards': [],
+        'quizzes': [],
+        'revision_plan': {},
+        'quiz_answers': {},
+        'quiz_results': {},
+        'quiz_correct': 0,  # number of correct entries in quiz_results
+        'current_card': 0,  # study-mode position in flashcards
+        'current_file_id': None,
+        'initialized': True
+    })
 
 
 def main():
@@ -63,12 +402,13 @@ def main():
     with st.sidebar:
         st.header("⚙️ Configuration")
         
-        # Reload config to get latest .env values
-        import importlib
-        importlib.reload(config)
+        # Re-read .env only on request rather than on every rerun
+        if st.button("🔄 Reload config"):
+            importlib.reload(config)
+            get_gemini_api_key.clear()
         
         # API Key - Load from environment only, no user input
-        current_key = config.GEMINI_API_KEY or os.getenv("GEMINI_API_KEY", "")
+        current_key = get_gemini_api_key()
         
         # Check if key exists and show status
         if current_key:
@@ -105,68 +445,83 @@ def main():
         dashboard_page()
 
 
+@st.fragment
+def saved_files_fragment():
+    """Saved-file picker; choosing a file reruns only this block, processing one reruns the page"""
+    pdf_files = list_saved_pdfs(config.UPLOAD_DIR)
+    if not pdf_files:
+        return
+    
+    # Path and size of each file by name, from the same cached listing
+    saved = {name: (path, size) for path, name, size, _ in pdf_files}
+    
+    st.subheader("📁 Saved Files")
+    cols = st.columns([3, 1])
+    with cols[0]:
+        selected_file = st.selectbox(
+            "Select a saved file to process:",
+            options=["-- Upload New File --"] + list(saved),
+            key="saved_file_selector"
+        )
+    with cols[1]:
+        if selected_file and selected_file != "-- Upload New File --":
+            if st.button("🔄 Process Selected File", type="primary"):
+                file_path, file_size = saved[selected_file]
+                if os.path.exists(file_path):
+                    with st.spinner("Processing saved file..."):
+                        try:
+                            # The file is already saved, so only its hash is needed, not its contents
+                            file_hash = file_sha256(file_path)
+                            db = get_study_database()
+                            existing = db.get_file_by_hash(file_hash)
+                            if existing:
+                                # Known contents: reuse the row and its topics (no topic LLM call, no write)
+                                content = process_pdf_cached(
+                                    None,
+                                    file_hash,
+                                    selected_file,
+                                    file_path=file_path,
+                                    topics=db.get_topics(existing['id']) or None
+                                )
+                                st.session_state.current_file_id = existing['id']
+                            else:
+                                content = process_pdf_cached(None, file_hash, selected_file, file_path=file_path)
+                                # Save file and its topics in database
+                                record_processed_file(
+                                    selected_file,
+                                    file_path,
+                                    file_size,
+                                    content.get('topics', []),
+                                    file_hash
+                                )
+                            st.session_state.processed_content = content
+                            
+                            # The rest of the page depends on the processed content
+                            st.rerun(scope="app")
+                        except Exception as e:
+                            st.error(f"❌ Error processing file: {str(e)}")
+    
+    # Show file list (only built when asked for; a collapsed expander would still render it)
+    if st.checkbox("📋 View All Saved Files", key="show_saved_files"):
+        # One caption for the whole list, one line per file
+        st.caption("  \n".join(
+            f"📄 {name} ({size / 1024:.2f} KB) - "
+            f"Saved: {datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')}"
+            for _, name, size, mtime in pdf_files
+        ))
+
+
+def clear_processed_content():
+    """Button callback: drop the processed file and everything generated from it"""
+    st.session_state.update({'processed_content': None, 'flashcards': [], 'quizzes': []})
+
+
 def upload_page():
     """File upload and processing page"""
     st.header("📄 Upload Study Material")
     
     # Show saved files section first
-    import config
-    if os.path.exists(config.UPLOAD_DIR):
-        pdf_files = glob.glob(os.path.join(config.UPLOAD_DIR, "*.pdf"))
-        if pdf_files:
-            st.subheader("📁 Saved Files")
-            cols = st.columns([3, 1])
-            with cols[0]:
-                selected_file = st.selectbox(
-                    "Select a saved file to process:",
-                    options=["-- Upload New File --"] + [os.path.basename(f) for f in sorted(pdf_files, key=os.path.getmtime, reverse=True)],
-                    key="saved_file_selector"
-                )
-            with cols[1]:
-                if selected_file and selected_file != "-- Upload New File --":
-                    if st.button("🔄 Process Selected File", type="primary"):
-                        file_path = os.path.join(config.UPLOAD_DIR, selected_file)
-                        if os.path.exists(file_path):
-                            with st.spinner("Processing saved file..."):
-                                try:
-                                    # Create a file-like object from saved file
-                                    class SavedFile:
-                                        def __init__(self, path):
-                                            self.name = os.path.basename(path)
-                                            self.path = path
-                                        def getbuffer(self):
-                                            with open(self.path, 'rb') as f:
-                                                return f.read()
-                                    
-                                    saved_file_obj = SavedFile(file_path)
-                                    content = st.session_state.reader_agent.process_file(saved_file_obj)
-                                    st.session_state.processed_content = content
-                                    
-                                    # Save/update file in database
-                                    file_size = os.path.getsize(file_path)
-                                    file_id = st.session_state.db.add_file(
-                                        selected_file,
-                                        file_path,
-                                        file_size
-                                    )
-                                    st.session_state.current_file_id = file_id
-                                    
-                                    # Save topics to database
-                                    if content.get('topics'):
-                                        st.session_state.db.add_topics(file_id, content.get('topics', []))
-                                    
-                                    st.success(f"✅ File '{selected_file}' processed successfully!")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"❌ Error processing file: {str(e)}")
-            
-            # Show file list
-            with st.expander("📋 View All Saved Files", expanded=False):
-                for pdf_file in sorted(pdf_files, key=os.path.getmtime, reverse=True):
-                    file_name = os.path.basename(pdf_file)
-                    file_size = os.path.getsize(pdf_file) / 1024
-                    mod_time = datetime.fromtimestamp(os.path.getmtime(pdf_file))
-                    st.caption(f"📄 {file_name} ({file_size:.2f} KB) - Saved: {mod_time.strftime('%Y-%m-%d %H:%M')}")
+    saved_files_fragment()
     
     st.markdown("---")
     st.subheader("📤 Upload New File")
@@ -181,37 +536,14 @@ def upload_page():
         st.success(f"✅ File uploaded: {uploaded_file.name}")
         
         # Show file info
-        file_size = len(uploaded_file.getbuffer())
+        file_size = uploaded_file.size
         st.caption(f"File size: {file_size / 1024:.2f} KB")
         
         if st.button("🚀 Process File", type="primary"):
             with st.spinner("Processing your study material..."):
                 try:
-                    # Process file with Reader Agent
-                    content = st.session_state.reader_agent.process_file(uploaded_file)
-                    st.session_state.processed_content = content
-                    
-                    # Save file to database
-                    import config as cfg
-                    file_path = os.path.join(cfg.UPLOAD_DIR, uploaded_file.name)
-                    # Check if file exists (it should after processing)
-                    if not os.path.exists(file_path):
-                        # Find the actual saved file path
-                        saved_files = glob.glob(os.path.join(cfg.UPLOAD_DIR, uploaded_file.name.replace('.pdf', '*.pdf')))
-                        if saved_files:
-                            file_path = saved_files[0]
-                    
-                    if os.path.exists(file_path):
-                        file_id = st.session_state.db.add_file(
-                            uploaded_file.name,
-                            file_path,
-                            file_size
-                        )
-                        st.session_state.current_file_id = file_id
-                        
-                        # Save topics to database
-                        if content.get('topics'):
-                            st.session_state.db.add_topics(file_id, content.get('topics', []))
+                    # Process file with Reader Agent (and save it to the database)
+                    content = process_upload(uploaded_file)
                     
                     st.success("✅ File processed successfully!")
                     
@@ -228,29 +560,32 @@ def upload_page():
                     st.subheader("📄 Extracted Text")
                     raw_text = content.get('raw_text', '')
                     if raw_text:
-                        # Show first 2000 characters with option to see more
-                        text_preview = raw_text[:2000] if len(raw_text) > 2000 else raw_text
+                        # Send only a preview to the browser; the full text is available as a download
+                        text_preview = raw_text[:TEXT_PREVIEW_CHARS]
+                        if len(raw_text) > TEXT_PREVIEW_CHARS:
+                            text_preview += "\n...[truncated]"
                         with st.expander("📖 View Extracted Text", expanded=False):
                             st.text_area(
                                 "Extracted Content:",
-                                value=raw_text,
+                                value=text_preview,
                                 height=400,
                                 disabled=True,
                                 label_visibility="collapsed"
                             )
                             st.caption(f"Total characters: {len(raw_text):,}")
+                            st.download_button(
+                                label="📥 Download Full Text",
+                                data=raw_text,
+                                file_name=f"{os.path.splitext(uploaded_file.name)[0]}.txt",
+                                mime="text/plain"
+                            )
                     else:
                         st.warning("⚠️ No text extracted from the file.")
                     
                     # Show identified topics
                     if content.get('topics'):
                         st.subheader("📋 Identified Topics")
-                        for i, topic in enumerate(content['topics'][:10], 1):
-                            with st.expander(f"Topic {i}: {topic.get('topic', 'Unknown')}"):
-                                if topic.get('subtopics'):
-                                    st.write("**Subtopics:**", ", ".join(topic['subtopics'][:5]))
-                                if topic.get('key_concepts'):
-                                    st.write("**Key Concepts:**", ", ".join(topic['key_concepts'][:5]))
+                        st.markdown(render_topic_list(content['topics'][:10]), unsafe_allow_html=True)
                     
                     # Show text chunks info
                     chunks = content.get('chunks', [])
@@ -258,22 +593,13 @@ def upload_page():
                         st.subheader("📚 Text Chunks")
                         st.info(f"Document split into {len(chunks)} chunks for processing.")
                         with st.expander("View Chunk Details", expanded=False):
-                            for i, chunk in enumerate(chunks[:5], 1):  # Show first 5 chunks
-                                st.markdown(f"**Chunk {i}** ({len(chunk)} characters):")
-                                st.text(chunk[:300] + "..." if len(chunk) > 300 else chunk)
-                                st.markdown("---")
+                            # Show first 5 chunks
+                            st.markdown(render_chunk_previews(chunks[:5], 300), unsafe_allow_html=True)
                             if len(chunks) > 5:
                                 st.caption(f"... and {len(chunks) - 5} more chunks")
                     
                     # Show saved file location
-                    saved_file_path = os.path.join(config.UPLOAD_DIR, uploaded_file.name)
-                    if not os.path.exists(saved_file_path):
-                        # Check if file was saved with timestamp
-                        pattern = os.path.join(config.UPLOAD_DIR, f"{os.path.splitext(uploaded_file.name)[0]}*.pdf")
-                        matches = glob.glob(pattern)
-                        if matches:
-                            saved_file_path = matches[-1]
-                    
+                    saved_file_path = content['file_path']
                     if os.path.exists(saved_file_path):
                         st.success(f"💾 File saved successfully to: `{saved_file_path}`")
                         st.info("💡 You can now navigate to Flashcards or Quizzes pages. The file is saved and can be reprocessed anytime!")
@@ -302,15 +628,111 @@ def upload_page():
             current_file = st.session_state.processed_content.get('file_name', 'Unknown')
             st.caption(f"📄 Currently processed: {current_file}")
             
-            if st.button("🔄 Clear Processed Content"):
-                st.session_state.processed_content = None
-                st.session_state.flashcards = []
-                st.session_state.quizzes = []
-                st.rerun()
+            st.button("🔄 Clear Processed Content", on_click=clear_processed_content)
         else:
             st.info("👆 Please upload a PDF file or select a saved file to get started")
 
 
+@st.fragment(run_every="1s")
+def flashcard_job_status():
+    """Poll the background flashcard job; once it finishes, store the outcome and rerun the page"""
+    job = st.session_state.get('flashcard_job')
+    if job is None:
+        return
+    if not job.done():
+        # Show the cards finished so far; this fragment reruns every second until the job is done
+        partial = list(st.session_state.flashcard_job_partial)
+        st.info(f"⏳ Generating flashcards for **{st.session_state.flashcard_job_file}** in the background... "
+                f"{len(partial)} ready so far.")
+        if partial:
+            st.markdown(render_flashcard_grid(partial), unsafe_allow_html=True)
+        return
+    
+    del st.session_state['flashcard_job']
+    try:
+        flashcards = job.result()
+    except TimeoutError as e:
+        outcome = ("error", f"⏱️ {str(e)}\n\n💡 Try processing a smaller PDF or wait a moment and try again.")
+    except ValueError as e:
+        error_msg = str(e)
+        if "API key" in error_msg or "key" in error_msg.lower() or "GROQ" in error_msg:
+            outcome = ("error", f"🔑 {error_msg}\n\n💡 Please check your Groq API key in Streamlit Cloud Secrets or .env file.")
+        else:
+            outcome = ("error", f"❌ {error_msg}\n\n💡 The AI model may have returned an invalid response. Try again.")
+    except Exception as e:
+        outcome = ("error", generation_error_markdown(e, "flashcards", "Groq", "GROQ_API_KEY"))
+    else:
+        if flashcards:
+            st.session_state.flashcards = flashcards
+            outcome = ("success", f"✅ Generated {len(flashcards)} flashcards from PDF: **{st.session_state.flashcard_job_file}**!")
+        else:
+            outcome = ("error", "❌ No flashcards were generated. The LLM might not have returned valid flashcards.\n\n"
+                                "💡 Check the console for the LLM responses, or try again - sometimes the API needs a retry.")
+    st.session_state.flashcard_job_outcome = outcome
+    st.rerun()
+
+
+def step_card(delta: int):
+    """Button callback: move the study-mode card by delta, staying within the deck"""
+    card = min(max(st.session_state.current_card + delta, 0), len(st.session_state.flashcards) - 1)
+    if card != st.session_state.current_card:
+        st.session_state.current_card = card
+
+
+@st.fragment
+def study_mode_fragment():
+    """Flashcard study mode; its buttons rerun only this fragment, not the whole page"""
+    card = st.session_state.flashcards[st.session_state.current_card]
+    
+    st.markdown("---")
+    st.markdown(f"### Card {st.session_state.current_card + 1} of {len(st.session_state.flashcards)}")
+    
+    # Sticky note style in study mode
+    st.markdown(
+        f"""
+        <div style="
+            background: linear-gradient(135deg, #ffd89b 0%, #ffecd2 100%);
+            padding: 20px;
+            border-radius: 10px;
+            border-left: 5px solid #ff6b6b;
+            box-shadow: 0 3px 6px rgba(0,0,0,0.15);
+            margin: 20px 0;
+        ">
+            <h3 style="color: #333; margin-top: 0;">📌 {card['question']}</h3>
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
+    
+    if st.button("👁️ Show Answer", type="primary"):
+        st.markdown(
+            f"""
+            <div style="
+                background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%);
+                padding: 20px;
+                border-radius: 10px;
+                border-left: 5px solid #4ecdc4;
+                box-shadow: 0 3px 6px rgba(0,0,0,0.15);
+                margin: 20px 0;
+            ">
+                <h4 style="color: #333; margin-top: 0;">💡 Answer:</h4>
+                <p style="color: #555; font-size: 1.1em;">{card['answer']}</p>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+    
+    # Callbacks update the card before the fragment reruns, so no extra rerun is needed
+    last_card = len(st.session_state.flashcards) - 1
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("⬅️ Previous", on_click=step_card, args=(-1,),
+                  disabled=st.session_state.current_card <= 0)
+    with col2:
+        st.button("➡️ Next", on_click=step_card, args=(1,),
+                  disabled=st.session_state.current_card >= last_card)
+
+
 def flashcards_page():
     """Flashcards page"""
     st.header("🃏 Flashcards")
@@ -329,32 +751,13 @@ def flashcards_page():
         
         if uploaded_file is not None:
             st.success(f"✅ File uploaded: {uploaded_file.name}")
-            file_size = len(uploaded_file.getbuffer())
+            file_size = uploaded_file.size
             st.caption(f"File size: {file_size / 1024:.2f} KB")
             
             if st.button("🚀 Process File", type="primary", key="process_flashcard"):
                 with st.spinner("Processing your study material..."):
                     try:
-                        content = st.session_state.reader_agent.process_file(uploaded_file)
-                        st.session_state.processed_content = content
-                        
-                        # Save file to database
-                        import config as cfg
-                        file_path = os.path.join(cfg.UPLOAD_DIR, uploaded_file.name)
-                        if not os.path.exists(file_path):
-                            saved_files = glob.glob(os.path.join(cfg.UPLOAD_DIR, uploaded_file.name.replace('.pdf', '*.pdf')))
-                            if saved_files:
-                                file_path = saved_files[0]
-                        
-                        if os.path.exists(file_path):
-                            file_id = st.session_state.db.add_file(
-                                uploaded_file.name,
-                                file_path,
-                                file_size
-                            )
-                            st.session_state.current_file_id = file_id
-                            if content.get('topics'):
-                                st.session_state.db.add_topics(file_id, content.get('topics', []))
+                        process_upload(uploaded_file)
                         
                         st.success("✅ File processed successfully! Now you can generate flashcards.")
                         st.rerun()
@@ -366,37 +769,43 @@ def flashcards_page():
     if st.session_state.processed_content:
         current_file = st.session_state.processed_content.get('file_name', 'Unknown')
         chunks = st.session_state.processed_content.get('chunks', [])
-        num_chunks_available = len(chunks)
         
-        # Show file info
+        # Show file info (counts are computed once, when the file is processed)
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("📄 File", current_file)
         with col2:
-            st.metric("📦 Chunks", num_chunks_available)
+            st.metric("📦 Chunks", st.session_state.processed_content.get('num_chunks', 0))
         with col3:
-            total_chars = sum(len(chunk) for chunk in chunks) if chunks else 0
+            total_chars = st.session_state.processed_content.get('total_chars', 0)
             st.metric("📝 Total Text", f"{total_chars:,} chars")
         
-        # Debug: Show chunk details
-        if chunks:
-            with st.expander("🔍 Debug: View Chunk Details", expanded=False):
-                for i, chunk in enumerate(chunks[:3]):  # Show first 3 chunks
-                    st.markdown(f"**Chunk {i+1}:** ({len(chunk)} characters)")
-                    st.text(chunk[:200] + "..." if len(chunk) > 200 else chunk)
-                    st.markdown("---")
+        # Debug: Show chunk details (expander bodies always run, so gate them on a toggle)
+        if chunks and st.checkbox("🔍 Debug: Show chunk details", key="flashcard_chunk_debug"):
+            with st.container(border=True):
+                # Show first 3 chunks
+                st.markdown(render_chunk_previews(chunks[:3], 200), unsafe_allow_html=True)
         
         # Option to load existing flashcards from database
-        if st.session_state.current_file_id:
-            existing_flashcards = st.session_state.flashcard_agent.load_flashcards(st.session_state.current_file_id)
+        file_id = get_current_file_id()
+        if file_id:
+            # Read straight from the database so viewing this page does not load the flashcard agent
+            existing_flashcards = get_study_database().get_flashcards(file_id)
             if existing_flashcards and len(existing_flashcards) > 0:
                 if st.button("📥 Load Existing Flashcards from Database", key="load_flashcards"):
                     st.session_state.flashcards = existing_flashcards
                     st.success(f"✅ Loaded {len(existing_flashcards)} flashcards from database!")
-                    st.rerun()
+    
+    # Background generation: progress while running, then its outcome once
+    if st.session_state.get('flashcard_job') is not None:
+        flashcard_job_status()
+    elif 'flashcard_job_outcome' in st.session_state:
+        kind, message = st.session_state.pop('flashcard_job_outcome')
+        (st.success if kind == "success" else st.error)(message)
     
     # Generate flashcards
-    if st.button("✨ Generate Flashcards", type="primary"):
+    job_running = st.session_state.get('flashcard_job') is not None
+    if st.button("✨ Generate Flashcards", type="primary", disabled=job_running):
         try:
             # Check if processed content exists
             if st.session_state.processed_content is None:
@@ -448,128 +857,37 @@ def flashcards_page():
                 # Debug: Show what's being sent
                 st.info(f"📤 Sending {len(valid_chunks)} chunks to LLM for flashcard generation...")
                 with st.expander("🔍 Debug: View Chunks Being Sent", expanded=False):
-                    for i, chunk in enumerate(valid_chunks[:3]):
-                        st.markdown(f"**Chunk {i+1}:** ({len(chunk)} chars)")
-                        st.text(chunk[:300] + "..." if len(chunk) > 300 else chunk)
-                
-                # Store last error for debugging
-                last_error = None
-                last_response = None
+                    st.markdown(render_chunk_previews(valid_chunks[:3], 300), unsafe_allow_html=True)
                 
-                try:
-                    # Verify processed_content is available
-                    if st.session_state.processed_content is None:
-                        st.error("❌ ERROR: processed_content is None! File was not processed correctly.")
-                        return
-                    
-                    # Verify chunks are available
-                    if not valid_chunks or len(valid_chunks) == 0:
-                        st.error("❌ ERROR: No valid chunks available!")
-                        return
-                    
-                    print(f"\n{'='*60}")
-                    print(f"FLASHCARD GENERATION STARTING")
-                    print(f"{'='*60}")
-                    print(f"Number of chunks: {len(valid_chunks)}")
-                    print(f"First chunk length: {len(valid_chunks[0]) if valid_chunks else 0}")
-                    print(f"First chunk preview: {valid_chunks[0][:200] if valid_chunks else 'N/A'}...")
-                    print(f"{'='*60}\n")
-                    
-                    flashcards = st.session_state.flashcard_agent.generate_from_chunks(valid_chunks, max_chunks=5)
-                    
-                    if flashcards and len(flashcards) > 0:
-                        st.session_state.flashcards = flashcards
-                        # Save to database with file_id
-                        st.session_state.flashcard_agent.save_flashcards(flashcards, st.session_state.current_file_id)
-                        st.success(f"✅ Generated {len(flashcards)} flashcards from PDF: **{current_file}**!")
-                        st.rerun()
-                    else:
-                        st.error("❌ No flashcards were generated. The LLM might not have returned valid flashcards.")
-                        st.info("💡 Possible reasons:")
-                        st.info("   • The LLM response was not in the expected JSON format")
-                        st.info("   • The content might need clearer structure")
-                        st.info("   • Try again - sometimes the API needs a retry")
-                except Exception as gen_error:
-                    last_error = str(gen_error)
-                    st.error(f"❌ Error generating flashcards: {last_error}")
-                    
-                    # Try to extract response from error message
-                    if "LLM response" in last_error or "response" in last_error.lower():
-                        # Try to find response in error
-                        import re
-                        response_match = re.search(r'response.*?:(.*?)(?:\.\.\.|$)', last_error, re.IGNORECASE)
-                        if response_match:
-                            last_response = response_match.group(1).strip()
+                print(f"\n{'='*60}")
+                print(f"FLASHCARD GENERATION STARTING")
+                print(f"{'='*60}")
+                print(f"Number of chunks: {len(valid_chunks)}")
+                print(f"First chunk length: {len(valid_chunks[0]) if valid_chunks else 0}")
+                print(f"First chunk preview: {valid_chunks[0][:200] if valid_chunks else 'N/A'}...")
+                print(f"{'='*60}\n")
                 
-                # Show technical details if error occurred
-                if last_error or (not flashcards or len(flashcards) == 0):
-                    with st.expander("🔍 Technical Debug Info", expanded=True):
-                        st.warning("⚠️ Check the console/terminal for detailed error logs")
-                        st.code("Look for messages starting with: 📥, 📊, ✅, ❌, ⚠️")
-                        st.markdown("---")
-                        st.markdown("**To debug:**")
-                        st.markdown("1. Open the terminal/console where Streamlit is running")
-                        st.markdown("2. Look for lines starting with `📥 LLM Response`")
-                        st.markdown("3. Check if the response is valid JSON")
-                        st.markdown("4. Share the error logs if the issue persists")
-                        
-                        if last_error:
-                            st.markdown("---")
-                            st.markdown("**Last Error:**")
-                            st.code(last_error[:500])
-                        
-                        if last_response:
-                            st.markdown("---")
-                            st.markdown("**LLM Response Preview:**")
-                            st.code(last_response[:1000])
-                        
-                        # Try to show a retry button
-                        if st.button("🔄 Retry Flashcard Generation", type="secondary"):
-                            st.rerun()
-                        
-                        # Add fallback option
-                        st.markdown("---")
-                        st.markdown("**Alternative:** Try using Gemini instead of Groq")
-                        if st.button("🔄 Try with Gemini API", type="secondary", key="retry_gemini"):
-                            # Temporarily change provider
-                            try:
-                                # Create a new flashcard agent instance for this attempt
-                                from agents.flashcard import FlashcardAgent
-                                temp_agent = FlashcardAgent()
-                                # Modify to use Gemini
-                                flashcards = temp_agent.generate_from_chunks(valid_chunks, max_chunks=3)
-                                if flashcards and len(flashcards) > 0:
-                                    st.session_state.flashcards = flashcards
-                                    st.session_state.flashcard_agent.save_flashcards(flashcards, st.session_state.current_file_id)
-                                    st.success(f"✅ Generated {len(flashcards)} flashcards using Gemini!")
-                                    st.rerun()
-                                else:
-                                    st.error("❌ Gemini also failed to generate flashcards")
-                            except Exception as gemini_error:
-                                st.error(f"❌ Gemini error: {str(gemini_error)}")
+                # Generate on a worker thread; flashcard_job_status polls for the result
+                st.session_state.flashcard_job_partial = []
+                st.session_state.flashcard_job = get_job_executor().submit(
+                    generate_flashcards_job,
+                    get_flashcard_agent(),
+                    valid_chunks,
+                    get_current_file_id(),
+                    st.session_state.flashcard_job_partial
+                )
+                st.session_state.flashcard_job_file = current_file
+                st.rerun()
         except TimeoutError as e:
-            st.error(f"⏱️ {str(e)}")
-            st.info("💡 Try processing a smaller PDF or wait a moment and try again.")
+            st.error(f"⏱️ {str(e)}\n\n💡 Try processing a smaller PDF or wait a moment and try again.")
         except ValueError as e:
             error_msg = str(e)
             if "API key" in error_msg or "key" in error_msg.lower() or "GROQ" in error_msg:
-                st.error(f"🔑 {error_msg}")
-                st.info("💡 Please check your Groq API key in Streamlit Cloud Secrets or .env file.")
+                st.error(f"🔑 {error_msg}\n\n💡 Please check your Groq API key in Streamlit Cloud Secrets or .env file.")
             else:
-                st.error(f"❌ {error_msg}")
-                st.info("💡 The AI model may have returned an invalid response. Try again.")
+                st.error(f"❌ {error_msg}\n\n💡 The AI model may have returned an invalid response. Try again.")
         except Exception as e:
-            error_msg = str(e)
-            st.error(f"❌ Error generating flashcards: {error_msg}")
-            st.info("💡 Please check:")
-            st.info("   • Your Groq API key is configured correctly (for flashcards)")
-            st.info("   • You have internet connection")
-            st.info("   • Try again with a smaller PDF")
-            if "GROQ" in error_msg.upper() or "groq" in error_msg.lower():
-                st.warning("⚠️ Flashcard generation uses Groq API. Make sure GROQ_API_KEY is set!")
-            # Show full error in expander for debugging
-            with st.expander("🔍 Technical Details"):
-                st.code(str(e))
+            st.error(generation_error_markdown(e, "flashcards", "Groq", "GROQ_API_KEY"))
     
     # Display flashcards
     if st.session_state.flashcards:
@@ -580,90 +898,16 @@ def flashcards_page():
         
         if display_mode == "Study Mode":
             # Interactive study mode
-            if 'current_card' not in st.session_state:
-                st.session_state.current_card = 0
-            
-            card = st.session_state.flashcards[st.session_state.current_card]
-            
-            st.markdown("---")
-            st.markdown(f"### Card {st.session_state.current_card + 1} of {len(st.session_state.flashcards)}")
-            
-            # Sticky note style in study mode
-            st.markdown(
-                f"""
-                <div style="
-                    background: linear-gradient(135deg, #ffd89b 0%, #ffecd2 100%);
-                    padding: 20px;
-                    border-radius: 10px;
-                    border-left: 5px solid #ff6b6b;
-                    box-shadow: 0 3px 6px rgba(0,0,0,0.15);
-                    margin: 20px 0;
-                ">
-                    <h3 style="color: #333; margin-top: 0;">📌 {card['question']}</h3>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-            
-            if st.button("👁️ Show Answer", type="primary"):
-                st.markdown(
-                    f"""
-                    <div style="
-                        background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%);
-                        padding: 20px;
-                        border-radius: 10px;
-                        border-left: 5px solid #4ecdc4;
-                        box-shadow: 0 3px 6px rgba(0,0,0,0.15);
-                        margin: 20px 0;
-                    ">
-                        <h4 style="color: #333; margin-top: 0;">💡 Answer:</h4>
-                        <p style="color: #555; font-size: 1.1em;">{card['answer']}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("⬅️ Previous") and st.session_state.current_card > 0:
-                    st.session_state.current_card -= 1
-                    st.rerun()
-            with col2:
-                if st.button("➡️ Next") and st.session_state.current_card < len(st.session_state.flashcards) - 1:
-                    st.session_state.current_card += 1
-                    st.rerun()
+            study_mode_fragment()
         
         else:
-            # Show all flashcards in sticky note style
-            cols = st.columns(2)  # 2 columns for sticky note layout
-            for i, card in enumerate(st.session_state.flashcards):
-                col_idx = i % 2
-                with cols[col_idx]:
-                    # Sticky note style card
-                    st.markdown(
-                        f"""
-                        <div style="
-                            background: linear-gradient(135deg, #ffd89b 0%, #ffecd2 100%);
-                            padding: 15px;
-                            border-radius: 8px;
-                            border-left: 4px solid #ff6b6b;
-                            margin-bottom: 15px;
-                            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                            min-height: 120px;
-                        ">
-                            <h4 style="color: #333; margin-top: 0;">📌 {card['question']}</h4>
-                            <p style="color: #555; font-size: 0.95em; margin-bottom: 0;">{card['answer']}</p>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
-                    if 'topic' in card:
-                        st.caption(f"🏷️ {card['topic']}")
+            # Show all flashcards in sticky note style: one HTML grid (2 columns) sent as a single element
+            st.markdown(flashcard_grid_html(st.session_state.flashcards), unsafe_allow_html=True)
         
         # Download option
         st.download_button(
             label="📥 Download Flashcards (JSON)",
-            data=json.dumps(st.session_state.flashcards, indent=2),
+            data=json_download('flashcards', st.session_state.flashcards),
             file_name="flashcards.json",
             mime="application/json"
         )
@@ -671,6 +915,80 @@ def flashcards_page():
         st.info("👆 Click 'Generate Flashcards' to create flashcards from your study material")
 
 
+@st.fragment
+def quiz_fragment():
+    """Quiz questions and score; answers are sent together with one submit, rerunning only this fragment"""
+    with st.form("quiz_form"):
+        selections = {}
+        for i, question in enumerate(st.session_state.quizzes):
+            st.markdown("---")
+            st.markdown(f"**Question {i+1}:** {question['question']}")
+            
+            # Options
+            options = question['options']
+            selections[i] = st.radio(
+                f"Select your answer:",
+                options,
+                key=f"quiz_q_{i}",
+                index=st.session_state.quiz_answers.get(i, None)
+            )
+            
+            # Show result if answered (as of the last submission)
+            result = st.session_state.quiz_results.get(i)
+            if result is not None:
+                if result['is_correct']:
+                    st.success(f"✅ Correct! {result.get('explanation', '')}")
+                else:
+                    correct_option = options[result['correct_answer']]
+                    st.error(f"❌ Incorrect. Correct answer: **{correct_option}**")
+                    if result.get('explanation'):
+                        st.info(f"💡 {result['explanation']}")
+        
+        submitted = st.form_submit_button("✅ Submit Answers", type="primary")
+    
+    if submitted:
+        for i, selected in selections.items():
+            if selected is None:
+                continue
+            question = st.session_state.quizzes[i]
+            selected_idx = question['options'].index(selected)
+            st.session_state.quiz_answers[i] = selected_idx
+            # Re-evaluate only answers that changed since the last submission
+            previous = st.session_state.quiz_results.get(i)
+            if previous is None or previous.get('selected_answer') != selected_idx:
+                result = get_quiz_agent().evaluate_answer(question, selected_idx)
+                result['selected_answer'] = selected_idx
+                st.session_state.quiz_results[i] = result
+                st.session_state.quiz_correct += int(result['is_correct']) - int(bool(previous and previous['is_correct']))
+        # Draw the feedback next to each question
+        st.rerun(scope="fragment")
+    
+    # Quiz summary
+    if len(st.session_state.quiz_results) == len(st.session_state.quizzes):
+        st.markdown("---")
+        st.subheader("📊 Quiz Results")
+        
+        correct = st.session_state.quiz_correct
+        total = len(st.session_state.quiz_results)
+        score = (correct / total * 100) if total > 0 else 0
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Score", f"{score:.1f}%")
+        with col2:
+            st.metric("Correct", f"{correct}/{total}")
+        with col3:
+            st.metric("Accuracy", f"{(correct/total*100):.1f}%")
+        
+        # Performance message
+        if score >= 80:
+            st.success("🎉 Excellent work! You have a strong understanding of the material.")
+        elif score >= 60:
+            st.info("👍 Good job! Consider reviewing the topics you missed.")
+        else:
+            st.warning("📚 Keep studying! Review the material and try again.")
+
+
 def quizzes_page():
     """Quizzes page"""
     st.header("📝 Quizzes")
@@ -689,32 +1007,13 @@ def quizzes_page():
         
         if uploaded_file is not None:
             st.success(f"✅ File uploaded: {uploaded_file.name}")
-            file_size = len(uploaded_file.getbuffer())
+            file_size = uploaded_file.size
             st.caption(f"File size: {file_size / 1024:.2f} KB")
             
             if st.button("🚀 Process File", type="primary", key="process_quiz"):
                 with st.spinner("Processing your study material..."):
                     try:
-                        content = st.session_state.reader_agent.process_file(uploaded_file)
-                        st.session_state.processed_content = content
-                        
-                        # Save file to database
-                        import config as cfg
-                        file_path = os.path.join(cfg.UPLOAD_DIR, uploaded_file.name)
-                        if not os.path.exists(file_path):
-                            saved_files = glob.glob(os.path.join(cfg.UPLOAD_DIR, uploaded_file.name.replace('.pdf', '*.pdf')))
-                            if saved_files:
-                                file_path = saved_files[0]
-                        
-                        if os.path.exists(file_path):
-                            file_id = st.session_state.db.add_file(
-                                uploaded_file.name,
-                                file_path,
-                                file_size
-                            )
-                            st.session_state.current_file_id = file_id
-                            if content.get('topics'):
-                                st.session_state.db.add_topics(file_id, content.get('topics', []))
+                        process_upload(uploaded_file)
                         
                         st.success("✅ File processed successfully! Now you can generate quiz.")
                         st.rerun()
@@ -739,108 +1038,54 @@ def quizzes_page():
                     num_chunks = min(3, len(chunks))
                     st.info(f"Processing {num_chunks} chunks (out of {len(chunks)} total)...")
                     
-                    questions = st.session_state.quiz_agent.generate_from_chunks(
-                        chunks, 
+                    # Take questions as chunks finish; chunks not needed yet are never requested
+                    progress = st.empty()
+                    questions = []
+                    for question in get_quiz_agent().generate_from_chunks_iter(
+                        chunks,
                         difficulty=difficulty,
-                        max_chunks=3
-                    )
+                        max_chunks=3,
+                        concurrency=2
+                    ):
+                        questions.append(question)
+                        progress.caption(f"Generated {len(questions)} / {num_questions} questions...")
+                        if len(questions) >= num_questions:
+                            break
+                    progress.empty()
+                    questions.sort(key=lambda q: q.get('chunk_id', 0))  # document order
                     
-                    st.session_state.quizzes = questions[:num_questions]
-                    st.session_state.quiz_agent.save_quiz(st.session_state.quizzes, st.session_state.current_file_id)
-                    st.session_state.quiz_answers = {}
-                    st.session_state.quiz_results = {}
+                    st.session_state.update({
+                        'quizzes': questions,
+                        'quiz_answers': {},
+                        'quiz_results': {},
+                        'quiz_correct': 0
+                    })
+                    get_quiz_agent().save_quiz(st.session_state.quizzes, get_current_file_id())
                     st.success(f"✅ Generated {len(st.session_state.quizzes)} quiz questions!")
-                    st.rerun()
                 else:
                     st.error("No content chunks available. Please process a file first.")
         except TimeoutError as e:
-            st.error(f"⏱️ {str(e)}")
-            st.info("💡 Try processing a smaller PDF or wait a moment and try again.")
+            st.error(f"⏱️ {str(e)}\n\n💡 Try processing a smaller PDF or wait a moment and try again.")
         except ValueError as e:
             error_msg = str(e)
             if "API key" in error_msg or "key" in error_msg.lower() or "DEEPSEEK" in error_msg:
-                st.error(f"🔑 {error_msg}")
-                st.info("💡 Please check your DeepSeek API key in Streamlit Cloud Secrets or .env file.")
+                st.error(f"🔑 {error_msg}\n\n💡 Please check your DeepSeek API key in Streamlit Cloud Secrets or .env file.")
             else:
-                st.error(f"❌ {error_msg}")
-                st.info("💡 The AI model may have returned an invalid response. Try again.")
+                st.error(f"❌ {error_msg}\n\n💡 The AI model may have returned an invalid response. Try again.")
         except Exception as e:
-            error_msg = str(e)
-            st.error(f"❌ Error generating quiz: {error_msg}")
-            st.info("💡 Please check:")
-            st.info("   • Your DeepSeek API key is configured correctly (for quizzes)")
-            st.info("   • You have internet connection")
-            st.info("   • Try again with a smaller PDF")
-            if "DEEPSEEK" in error_msg.upper() or "deepseek" in error_msg.lower():
-                st.warning("⚠️ Quiz generation uses DeepSeek API. Make sure DEEPSEEK_API_KEY is set!")
-            # Show full error in expander for debugging
-            with st.expander("🔍 Technical Details"):
-                st.code(str(e))
+            st.error(generation_error_markdown(e, "quizzes", "DeepSeek", "DEEPSEEK_API_KEY"))
     
     # Display quiz
     if st.session_state.quizzes:
         st.subheader(f"📋 Quiz ({len(st.session_state.quizzes)} questions)")
         
         # Take quiz
-        for i, question in enumerate(st.session_state.quizzes):
-            st.markdown("---")
-            st.markdown(f"**Question {i+1}:** {question['question']}")
-            
-            # Options
-            options = question['options']
-            selected = st.radio(
-                f"Select your answer:",
-                options,
-                key=f"quiz_q_{i}",
-                index=st.session_state.quiz_answers.get(i, None)
-            )
-            
-            if selected:
-                st.session_state.quiz_answers[i] = options.index(selected)
-            
-            # Show result if answered
-            if i in st.session_state.quiz_answers:
-                selected_idx = st.session_state.quiz_answers[i]
-                result = st.session_state.quiz_agent.evaluate_answer(question, selected_idx)
-                st.session_state.quiz_results[i] = result
-                
-                if result['is_correct']:
-                    st.success(f"✅ Correct! {result.get('explanation', '')}")
-                else:
-                    correct_option = options[result['correct_answer']]
-                    st.error(f"❌ Incorrect. Correct answer: **{correct_option}**")
-                    if result.get('explanation'):
-                        st.info(f"💡 {result['explanation']}")
-        
-        # Quiz summary
-        if len(st.session_state.quiz_results) == len(st.session_state.quizzes):
-            st.markdown("---")
-            st.subheader("📊 Quiz Results")
-            
-            correct = sum(1 for r in st.session_state.quiz_results.values() if r['is_correct'])
-            total = len(st.session_state.quiz_results)
-            score = (correct / total * 100) if total > 0 else 0
-            
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Score", f"{score:.1f}%")
-            with col2:
-                st.metric("Correct", f"{correct}/{total}")
-            with col3:
-                st.metric("Accuracy", f"{(correct/total*100):.1f}%")
-            
-            # Performance message
-            if score >= 80:
-                st.success("🎉 Excellent work! You have a strong understanding of the material.")
-            elif score >= 60:
-                st.info("👍 Good job! Consider reviewing the topics you missed.")
-            else:
-                st.warning("📚 Keep studying! Review the material and try again.")
+        quiz_fragment()
         
         # Download option
         st.download_button(
             label="📥 Download Quiz (JSON)",
-            data=json.dumps(st.session_state.quizzes, indent=2),
+            data=json_download('quizzes', st.session_state.quizzes),
             file_name="quiz.json",
             mime="application/json"
         )
@@ -861,11 +1106,14 @@ def planner_page():
         with st.spinner("Creating your personalized revision plan..."):
             topics = st.session_state.processed_content.get('topics', [])
             if topics:
-                plan = st.session_state.planner_agent.create_revision_plan(topics)
+                plan = create_plan_cached(
+                    st.session_state.processed_content['file_hash'],
+                    datetime.now().date().isoformat(),
+                    topics
+                )
                 st.session_state.revision_plan = plan
-                st.session_state.planner_agent.save_plan(plan, st.session_state.current_file_id)
+                get_planner_agent().save_plan(plan, get_current_file_id())
                 st.success("✅ Revision plan created successfully!")
-                st.rerun()
             else:
                 st.error("No topics found. Please process a file with identifiable topics.")
     
@@ -882,13 +1130,12 @@ def planner_page():
         
         # Upcoming revisions
         st.subheader("📆 Upcoming Revisions (Next 7 Days)")
-        upcoming = st.session_state.planner_agent.get_upcoming_revisions(plan, days_ahead=7)
+        upcoming = get_planner_agent().get_upcoming_revisions(plan, days_ahead=7)
         
         if upcoming:
             for task in upcoming:
                 with st.expander(f"📌 {task['topic']} - {task['date']}"):
-                    st.write(f"**Type:** {task['type']}")
-                    st.write(f"**Estimated Time:** {task['estimated_time']}")
+                    st.markdown(f"**Type:** {task['type']}  \n**Estimated Time:** {task['estimated_time']}")
         else:
             st.info("No revisions scheduled for the next 7 days.")
         
@@ -904,13 +1151,15 @@ def planner_page():
                 with col3:
                     st.write(f"**Study Time:** {topic_plan.get('estimated_study_time', 'N/A')}")
                 
-                st.write(f"**First Revision:** {topic_plan.get('first_revision', 'N/A')}")
-                st.write(f"**Subsequent Revisions:** {', '.join(topic_plan.get('subsequent_revisions', []))}")
+                st.markdown(
+                    f"**First Revision:** {topic_plan.get('first_revision', 'N/A')}  \n"
+                    f"**Subsequent Revisions:** {', '.join(topic_plan.get('subsequent_revisions', []))}"
+                )
         
         # Download option
         st.download_button(
             label="📥 Download Plan (JSON)",
-            data=json.dumps(plan, indent=2),
+            data=json_download('revision_plan', plan),
             file_name="revision_plan.json",
             mime="application/json"
         )
@@ -926,6 +1175,8 @@ def chat_page():
         st.warning("⚠️ Please upload and process a file first in the 'Upload & Process' page.")
         return
     
+    chat_agent = get_chat_agent()
+    
     # Chat interface
     st.markdown("Ask questions about your study material and get instant answers!")
     
@@ -936,18 +1187,17 @@ def chat_page():
         with st.spinner("Thinking..."):
             # Find relevant context
             chunks = st.session_state.processed_content.get('chunks', [])
-            context = st.session_state.chat_agent.find_relevant_context(question, chunks)
-            
-            # Get answer
-            result = st.session_state.chat_agent.answer_question(question, context, st.session_state.current_file_id)
-            
-            # Display answer
-            st.markdown("### 💡 Answer")
-            st.markdown(result['answer'])
-            st.caption(f"Confidence: {result.get('confidence', 'medium').title()}")
+            context = find_chat_context(chat_agent, question, st.session_state.processed_content['file_hash'], chunks)
+        
+        # Display the answer as it is generated
+        st.markdown("### 💡 Answer")
+        st.write_stream(chat_agent.answer_question_stream(
+            question, context, get_current_file_id()
+        ))
+        st.caption(f"Confidence: {chat_agent.last_confidence.title()}")
     
     # Conversation history
-    history = st.session_state.chat_agent.get_conversation_history()
+    history = chat_agent.get_conversation_history()
     if history:
         st.markdown("---")
         st.subheader("📜 Conversation History")
@@ -956,9 +1206,7 @@ def chat_page():
                 st.write(f"**Question:** {entry['question']}")
                 st.write(f"**Answer:** {entry['answer']}")
         
-        if st.button("🗑️ Clear History"):
-            st.session_state.chat_agent.clear_history()
-            st.rerun()
+        st.button("🗑️ Clear History", on_click=chat_agent.clear_history)
 
 
 def dashboard_page():
@@ -987,34 +1235,33 @@ def dashboard_page():
     # Quiz performance
     if st.session_state.quiz_results:
         st.subheader("📈 Quiz Performance")
-        correct = sum(1 for r in st.session_state.quiz_results.values() if r['is_correct'])
+        correct = st.session_state.quiz_correct
         total = len(st.session_state.quiz_results)
         accuracy = (correct / total * 100) if total > 0 else 0
         
         st.progress(accuracy / 100)
         st.caption(f"Overall Accuracy: {accuracy:.1f}% ({correct}/{total} correct)")
     
-    # Study progress
+    # Study progress (one element for the whole checklist)
     st.subheader("📚 Study Progress")
-    if st.session_state.processed_content:
-        st.success("✅ Study material processed and ready")
-    else:
-        st.warning("⚠️ No study material uploaded yet")
-    
-    if st.session_state.flashcards:
-        st.success(f"✅ {len(st.session_state.flashcards)} flashcards generated")
-    else:
-        st.info("💡 Generate flashcards to start studying")
-    
-    if st.session_state.quizzes:
-        st.success(f"✅ {len(st.session_state.quizzes)} quiz questions ready")
-    else:
-        st.info("💡 Generate quizzes to test your knowledge")
-    
-    if st.session_state.revision_plan:
-        st.success("✅ Revision plan created")
-    else:
-        st.info("💡 Create a revision plan to stay organized")
+    with st.container(border=True):
+        st.markdown(study_progress_markdown(
+            bool(st.session_state.processed_content),
+            len(st.session_state.flashcards),
+            len(st.session_state.quizzes),
+            bool(st.session_state.revision_plan)
+        ))
+
+
+def study_progress_markdown(has_content: bool, num_flashcards: int, num_quizzes: int, has_plan: bool) -> str:
+    """Dashboard study-progress checklist as a single markdown string"""
+    lines = [
+        "✅ Study material processed and ready" if has_content else "⚠️ No study material uploaded yet",
+        f"✅ {num_flashcards} flashcards generated" if num_flashcards else "💡 Generate flashcards to start studying",
+        f"✅ {num_quizzes} quiz questions ready" if num_quizzes else "💡 Generate quizzes to test your knowledge",
+        "✅ Revision plan created" if has_plan else "💡 Create a revision plan to stay organized"
+    ]
+    return "  \n".join(lines)
 
 
 if __name__ == "__main__":
@@ -32,10 +32,17 @@ class StudyDatabase:
                 file_size INTEGER,
                 uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 processed_at TIMESTAMP,
+                file_hash TEXT,
                 UNIQUE(file_path)
             )
         ''')
         
+        # Databases created before file_hash existed get the column added
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(files)')]
+        if 'file_hash' not in columns:
+            cursor.execute('ALTER TABLE files ADD COLUMN file_hash TEXT')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_hash ON files(file_hash)')
+        
         # Topics table - store identified topics
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS topics (
@@ -122,11 +129,44 @@ class StudyDatabase:
         conn.commit()
         conn.close()
     
-    def add_file(self, file_name: str, file_path: str, file_size: int) -> int:
-        """Add uploaded file to database"""
+    def add_file(self, file_name: str, file_path: str, file_size: int, file_hash: str = None) -> int:
+        """Add uploaded file to database (file_hash is the SHA-256 of its contents, if known)"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
+        file_id = self._upsert_file(cursor, file_name, file_path, file_size, file_hash)
+        
+        conn.commit()
+        conn.close()
+        return file_id
+    
+    def add_topics(self, file_id: int, topics: List[Dict]):
+        """Add topics for a file"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        self._replace_topics(cursor, file_id, topics)
+        
+        conn.commit()
+        conn.close()
+    
+    def add_file_with_topics(self, file_name: str, file_path: str, file_size: int,
+                             topics: List[Dict], file_hash: str = None) -> int:
+        """Add uploaded file and its topics (if any) to database in a single transaction"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        file_id = self._upsert_file(cursor, file_name, file_path, file_size, file_hash)
+        if topics:
+            self._replace_topics(cursor, file_id, topics)
+        
+        conn.commit()
+        conn.close()
+        return file_id
+    
+    @staticmethod
+    def _upsert_file(cursor, file_name: str, file_path: str, file_size: int, file_hash: Optional[str]) -> int:
+        """Insert a file row, or mark an existing one (same path) as processed again; returns its ID"""
         # Check if file already exists
         cursor.execute('SELECT id FROM files WHERE file_path = ?', (file_path,))
         existing = cursor.fetchone()
@@ -135,41 +175,55 @@ class StudyDatabase:
             file_id = existing[0]
             # Update processed_at
             cursor.execute(
-                'UPDATE files SET processed_at = ? WHERE id = ?',
-                (datetime.now().isoformat(), file_id)
+                'UPDATE files SET processed_at = ?, file_hash = COALESCE(?, file_hash) WHERE id = ?',
+                (datetime.now().isoformat(), file_hash, file_id)
             )
         else:
             cursor.execute(
-                'INSERT INTO files (file_name, file_path, file_size, processed_at) VALUES (?, ?, ?, ?)',
-                (file_name, file_path, file_size, datetime.now().isoformat())
+                'INSERT INTO files (file_name, file_path, file_size, processed_at, file_hash) VALUES (?, ?, ?, ?, ?)',
+                (file_name, file_path, file_size, datetime.now().isoformat(), file_hash)
             )
             file_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
         return file_id
     
-    def add_topics(self, file_id: int, topics: List[Dict]):
-        """Add topics for a file"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+    @staticmethod
+    def _replace_topics(cursor, file_id: int, topics: List[Dict]):
+        """Replace a file's topics with the given ones"""
         # Clear existing topics for this file
         cursor.execute('DELETE FROM topics WHERE file_id = ?', (file_id,))
         
-        for topic in topics:
-            cursor.execute(
-                'INSERT INTO topics (file_id, topic_name, subtopics, key_concepts) VALUES (?, ?, ?, ?)',
+        cursor.executemany(
+            'INSERT INTO topics (file_id, topic_name, subtopics, key_concepts) VALUES (?, ?, ?, ?)',
+            [
                 (
                     file_id,
                     topic.get('topic', ''),
                     json.dumps(topic.get('subtopics', [])),
                     json.dumps(topic.get('key_concepts', []))
                 )
-            )
+                for topic in topics
+            ]
+        )
+    
+    def get_topics(self, file_id: int) -> List[Dict]:
+        """Get topics for a file, in the format add_topics takes"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM topics WHERE file_id = ? ORDER BY id', (file_id,))
+        rows = cursor.fetchall()
+        
+        topics = []
+        for row in rows:
+            topics.append({
+                'topic': row['topic_name'],
+                'subtopics': json.loads(row['subtopics']) if row['subtopics'] else [],
+                'key_concepts': json.loads(row['key_concepts']) if row['key_concepts'] else []
+            })
         
-        conn.commit()
         conn.close()
+        return topics
     
     def save_flashcards(self, file_id: int, flashcards: List[Dict]):
         """Save flashcards to database"""
@@ -385,6 +439,30 @@ class StudyDatabase:
             }
         return None
     
+    def get_file_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """Get the most recently processed file with the given content hash"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            'SELECT * FROM files WHERE file_hash = ? ORDER BY processed_at DESC LIMIT 1',
+            (file_hash,)
+        )
+        row = cursor.fetchone()
+        
+        conn.close()
+        if row:
+            return {
+                'id': row['id'],
+                'file_name': row['file_name'],
+                'file_path': row['file_path'],
+                'file_size': row['file_size'],
+                'uploaded_at': row['uploaded_at'],
+                'processed_at': row['processed_at']
+            }
+        return None
+    
     def get_all_files(self) -> List[Dict]:
         """Get all uploaded files"""
         conn = sqlite3.connect(self.db_path)
@@ -1,10 +1,27 @@
 """LLM utility functions for interacting with AI models"""
-import json
 import os
-from typing import Dict, List, Any, Optional
-from langchain_core.messages import HumanMessage, SystemMessage
+import json
+from functools import lru_cache
+from typing import Dict, Iterator, List, Any, Optional
 import config
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    # Stdlib fallback; orjson.JSONDecodeError subclasses json.JSONDecodeError, so one except covers both
+    _json_loads = json.loads
+
+
+def _langchain_messages(prompt: str, system_message: Optional[str] = None) -> list:
+    """Build the message list for a LangChain chat model (LangChain is only imported on this path)"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    messages = []
+    if system_message:
+        messages.append(SystemMessage(content=system_message))
+    messages.append(HumanMessage(content=prompt))
+    return messages
+
 
 def get_llm(provider: str = "gemini", model_name: str = None, temperature: float = 0.7):
     """
@@ -159,6 +176,23 @@ def get_llm(provider: str = "gemini", model_name: str = None, temperature: float
         raise ValueError(f"Unknown provider: {provider}. Use 'gemini', 'groq', 'deepseek', or 'openai'")
 
 
+@lru_cache(maxsize=16)
+def _get_client(provider: str, model_name: Optional[str], temperature: float, timeout: int,
+                api_key: str, use_local: bool):
+    """
+    Get a cached LLM client (see get_llm)
+    
+    Building a client parses settings and sets up its HTTP session, so clients
+    are reused across calls. api_key and use_local are only part of the cache
+    key, so a changed key or mode in config yields a fresh client.
+    """
+    llm = get_llm(provider=provider, model_name=model_name, temperature=temperature)
+    # Set timeout if supported (once, on creation - the client is shared)
+    if hasattr(llm, 'timeout'):
+        llm.timeout = timeout
+    return llm
+
+
 def call_llm(prompt: str, system_message: str = None, provider: str = "gemini", 
               model_name: str = None, temperature: float = 0.7, timeout: int = 60) -> str:
     """
@@ -176,11 +210,12 @@ def call_llm(prompt: str, system_message: str = None, provider: str = "gemini",
         LLM response text
     """
     try:
-        # Reload config to get latest API key
-        import importlib
-        importlib.reload(config)
-        
-        llm = get_llm(provider=provider, model_name=model_name, temperature=temperature)
+        # Keys come from config as loaded at import (the UI's "Reload config" re-reads .env);
+        # reloading the module here would race with concurrent calls from worker threads
+        llm = _get_client(
+            provider.lower(), model_name, temperature, timeout,
+            getattr(config, f"{provider.upper()}_API_KEY", ""), config.USE_LOCAL_MODEL
+        )
         
         # If using direct Gemini API
         if llm == "gemini_direct":
@@ -233,14 +268,7 @@ def call_llm(prompt: str, system_message: str = None, provider: str = "gemini",
             raise Exception(f"Gemini API: No available models found. Tried: {models_to_try}. Error: {str(last_error)}")
         
         # Use langchain LLM
-        # Set timeout if supported
-        if hasattr(llm, 'timeout'):
-            llm.timeout = timeout
-        
-        messages = []
-        if system_message:
-            messages.append(SystemMessage(content=system_message))
-        messages.append(HumanMessage(content=prompt))
+        messages = _langchain_messages(prompt, system_message)
         
         print(f"Sending request to {provider} LLM...")
         print(f"   Prompt length: {len(prompt)} characters")
@@ -265,15 +293,107 @@ def call_llm(prompt: str, system_message: str = None, provider: str = "gemini",
             raise ValueError("Empty response from LLM. The model may have encountered an error.")
         return response_str
     except Exception as e:
-        error_msg = str(e)
-        if "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
-            raise TimeoutError(f"LLM request timed out after {timeout} seconds. Try with fewer chunks or smaller text.")
-        elif "api" in error_msg.lower() and ("key" in error_msg.lower() or "quota" in error_msg.lower() or "permission" in error_msg.lower()):
-            raise ValueError(f"API Error: {error_msg}. Please check your {provider.upper()} API key configuration.")
-        elif "empty" in error_msg.lower():
-            raise ValueError(error_msg)
-        else:
-            raise Exception(f"Error calling LLM ({provider}): {error_msg}")
+        raise _llm_error(e, provider, timeout)
+
+
+def stream_llm(prompt: str, system_message: str = None, provider: str = "gemini",
+               model_name: str = None, temperature: float = 0.7, timeout: int = 60) -> Iterator[str]:
+    """
+    Call LLM with a prompt and yield the response text as it is generated.
+    
+    Same providers and error handling as call_llm; the first piece arrives
+    after the time to first token instead of after the whole completion.
+    
+    Args:
+        prompt: User prompt
+        system_message: Optional system message
+        provider: Provider name ("gemini", "groq", "deepseek", "openai")
+        model_name: Model to use (overrides provider default)
+        temperature: Temperature for generation
+        timeout: Timeout in seconds (default: 60)
+        
+    Returns:
+        Iterator over pieces of the response text
+    """
+    received = False
+    try:
+        llm = _get_client(
+            provider.lower(), model_name, temperature, timeout,
+            getattr(config, f"{provider.upper()}_API_KEY", ""), config.USE_LOCAL_MODEL
+        )
+        
+        # If using direct Gemini API
+        if llm == "gemini_direct":
+            import google.generativeai as genai
+            genai.configure(api_key=config.GEMINI_API_KEY)
+            
+            full_prompt = prompt
+            if system_message:
+                full_prompt = f"{system_message}\n\n{prompt}"
+            
+            models_to_try = list(dict.fromkeys([
+                model_name or config.GEMINI_MODEL,
+                "gemini-1.5-flash",
+                "gemini-1.5-pro",
+                "gemini-pro"
+            ]))
+            
+            last_error = None
+            for model_name_attempt in models_to_try:
+                try:
+                    model = genai.GenerativeModel(model_name_attempt)
+                    response = model.generate_content(
+                        full_prompt,
+                        generation_config=genai.types.GenerationConfig(temperature=temperature),
+                        stream=True
+                    )
+                    for chunk in response:
+                        try:
+                            text = chunk.text
+                        except ValueError:  # chunk without text parts (e.g. safety metadata only)
+                            continue
+                        if text:
+                            received = True
+                            yield text
+                    if received:
+                        return
+                except Exception as e:
+                    error_str = str(e)
+                    # If it's a 404 before anything was streamed, try next model
+                    if not received and ("404" in error_str or "not found" in error_str.lower()):
+                        last_error = e
+                        continue
+                    raise
+            
+            raise Exception(f"Gemini API: No available models found. Tried: {models_to_try}. Error: {str(last_error)}")
+        
+        # Use langchain LLM
+        messages = _langchain_messages(prompt, system_message)
+        
+        for chunk in llm.stream(messages):
+            # Chat models stream message chunks, plain LLMs (e.g. Ollama) stream strings
+            text = chunk.content if hasattr(chunk, 'content') else chunk
+            if isinstance(text, str) and text:
+                received = True
+                yield text
+        
+        if not received:
+            raise ValueError("Empty response from LLM. The model may have encountered an error.")
+    except Exception as e:
+        raise _llm_error(e, provider, timeout)
+
+
+def _llm_error(e: Exception, provider: str, timeout: int) -> Exception:
+    """Translate a provider error into the exception call_llm and stream_llm raise"""
+    error_msg = str(e)
+    if "timeout" in error_msg.lower() or "timed out" in error_msg.lower():
+        return TimeoutError(f"LLM request timed out after {timeout} seconds. Try with fewer chunks or smaller text.")
+    elif "api" in error_msg.lower() and ("key" in error_msg.lower() or "quota" in error_msg.lower() or "permission" in error_msg.lower()):
+        return ValueError(f"API Error: {error_msg}. Please check your {provider.upper()} API key configuration.")
+    elif "empty" in error_msg.lower():
+        return ValueError(error_msg)
+    else:
+        return Exception(f"Error calling LLM ({provider}): {error_msg}")
 
 
 def parse_json_response(response: str) -> Any:
@@ -298,7 +418,7 @@ def parse_json_response(response: str) -> Any:
     response = response.strip()
     
     try:
-        return json.loads(response)
+        return _json_loads(response)
     except json.JSONDecodeError as e:
         # Try to extract JSON from response
         start_idx = response.find('[')
@@ -309,7 +429,7 @@ def parse_json_response(response: str) -> Any:
         
         if start_idx != -1 and end_idx > start_idx:
             try:
-                return json.loads(response[start_idx:end_idx])
+                return _json_loads(response[start_idx:end_idx])
             except:
                 pass
         
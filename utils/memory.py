@@ -1,6 +1,7 @@
 """Memory module using FAISS for semantic search and embeddings"""
 import os
 import pickle
+import threading
 import numpy as np
 from typing import List, Dict, Tuple
 import faiss
@@ -19,6 +20,8 @@ class MemoryModule:
         self.dimension = config.EMBEDDING_DIMENSION
         self.index_path = os.path.join(config.OUTPUT_DIR, "faiss_index.bin")
         self.metadata_path = os.path.join(config.OUTPUT_DIR, "faiss_metadata.pkl")
+        # One instance is shared across Streamlit sessions; guards index/texts/metadata and the saved files
+        self._lock = threading.RLock()
         
         # Initialize embedding model
         self._load_embedding_model()
@@ -85,20 +88,21 @@ class MemoryModule:
         # Normalize embeddings for better cosine similarity (optional)
         # faiss.normalize_L2(embeddings)
         
-        # Add to index
-        self.index.add(embeddings.astype('float32'))
-        
-        # Store texts and metadata
-        self.texts.extend(texts)
-        if metadata:
-            self.metadata.extend(metadata)
-        else:
-            self.metadata.extend([{}] * len(texts))
-        
-        print(f"Added {len(texts)} documents to memory. Total: {len(self.texts)}")
-        
-        # Save index
-        self.save()
+        with self._lock:
+            # Add to index
+            self.index.add(embeddings.astype('float32'))
+            
+            # Store texts and metadata
+            self.texts.extend(texts)
+            if metadata:
+                self.metadata.extend(metadata)
+            else:
+                self.metadata.extend([{}] * len(texts))
+            
+            print(f"Added {len(texts)} documents to memory. Total: {len(self.texts)}")
+            
+            # Save index
+            self.save()
     
     def search(self, query: str, k: int = 5) -> List[Tuple[str, float, Dict]]:
         """
@@ -117,19 +121,20 @@ class MemoryModule:
         # Generate query embedding
         query_embedding = self.embedding_model.encode([query], convert_to_numpy=True)
         
-        # Search
-        k = min(k, len(self.texts))  # Don't search for more than available
-        distances, indices = self.index.search(query_embedding.astype('float32'), k)
-        
-        # Format results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.texts):
-                results.append((
-                    self.texts[idx],
-                    float(distances[0][i]),
-                    self.metadata[idx]
-                ))
+        with self._lock:
+            # Search
+            k = min(k, len(self.texts))  # Don't search for more than available
+            distances, indices = self.index.search(query_embedding.astype('float32'), k)
+            
+            # Format results
+            results = []
+            for i, idx in enumerate(indices[0]):
+                if idx < len(self.texts):
+                    results.append((
+                        self.texts[idx],
+                        float(distances[0][i]),
+                        self.metadata[idx]
+                    ))
         
         return results
     
@@ -149,9 +154,10 @@ class MemoryModule:
             return []
         
         # If index is empty or small, add chunks temporarily
-        if len(self.texts) < len(chunks):
-            # Add chunks to index if not already there
-            self.add_documents(chunks)
+        with self._lock:
+            if len(self.texts) < len(chunks):
+                # Add chunks to index if not already there
+                self.add_documents(chunks)
         
         # Search for relevant chunks
         results = self.search(query, k=k)
@@ -159,28 +165,72 @@ class MemoryModule:
         # Return texts in order of relevance
         return [text for text, _, _ in results]
     
+    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Embed a document's chunks in one batch, as a per-document index for top_chunks.
+        
+        Args:
+            chunks: List of text chunks
+            
+        Returns:
+            (num_chunks, dim) float32 matrix of unit-length embeddings
+        """
+        if not chunks:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        embeddings = self.embedding_model.encode(chunks, convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def top_chunks(self, query: str, chunks: List[str], chunk_embeddings: np.ndarray,
+                   k: int = 3) -> List[str]:
+        """
+        Find the chunks most similar to a query using precomputed chunk embeddings.
+        
+        Only the query is embedded; chunks are scored with one matrix-vector product.
+        
+        Args:
+            query: Search query
+            chunks: List of text chunks
+            chunk_embeddings: Output of embed_chunks for these chunks
+            k: Number of chunks to return
+            
+        Returns:
+            List of most relevant chunks, best first
+        """
+        if not chunks:
+            return []
+        
+        query_embedding = self.embedding_model.encode([query], convert_to_numpy=True, normalize_embeddings=True)
+        scores = chunk_embeddings @ query_embedding[0].astype(np.float32)  # cosine similarity
+        
+        k = min(k, len(chunks))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [chunks[i] for i in top]
+    
     def save(self):
         """Save the FAISS index and metadata"""
         if not os.path.exists(config.OUTPUT_DIR):
             os.makedirs(config.OUTPUT_DIR)
         
         try:
-            faiss.write_index(self.index, self.index_path)
-            with open(self.metadata_path, 'wb') as f:
-                pickle.dump({
-                    'texts': self.texts,
-                    'metadata': self.metadata
-                }, f)
+            with self._lock:
+                faiss.write_index(self.index, self.index_path)
+                with open(self.metadata_path, 'wb') as f:
+                    pickle.dump({
+                        'texts': self.texts,
+                        'metadata': self.metadata
+                    }, f)
             print(f"Saved FAISS index to {self.index_path}")
         except Exception as e:
             print(f"Error saving FAISS index: {e}")
     
     def clear(self):
         """Clear all documents from memory"""
-        self._create_new_index()
-        if os.path.exists(self.index_path):
-            os.remove(self.index_path)
-        if os.path.exists(self.metadata_path):
-            os.remove(self.metadata_path)
+        with self._lock:
+            self._create_new_index()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            if os.path.exists(self.metadata_path):
+                os.remove(self.metadata_path)
         print("Memory cleared")
 
@@ -1,33 +1,124 @@
 """PDF text extraction utilities"""
 import fitz  # PyMuPDF
 import os
-from typing import List, Tuple
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
 
+# Below this many pages, starting worker processes costs more than it saves
+PARALLEL_MIN_PAGES = 16
 
-def extract_text_from_pdf(pdf_path: str) -> str:
+
+def extract_text_from_pdf(pdf_path: str, parallel: bool = False) -> str:
     """
     Extract all text from a PDF file.
     
+    Uses PyMuPDF, falling back to pypdfium2 (if installed) for documents
+    PyMuPDF can't parse.
+    
     Args:
         pdf_path: Path to the PDF file
+        parallel: Split large documents across worker processes (one page range each)
         
     Returns:
         Extracted text as a string
     """
-    try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            text += page.get_text()
-            text += "\n\n"  # Add spacing between pages
-        
-        doc.close()
-        return text.encode('utf-8', errors='ignore').decode('utf-8')
+    # Join once instead of growing the string page by page; keep a blank line after each page
+    return "".join(f"{page_text}\n\n" for page_text in iter_pdf_pages(pdf_path, parallel))
+
+
+def iter_pdf_pages(pdf_path: str, parallel: bool = False) -> Iterator[str]:
+    """
+    Yield the text of each page of a PDF file, in page order.
+    
+    Pages are read one at a time (unless extracted in parallel), so the whole
+    document's text never has to be held as a single string.
     
+    Args:
+        pdf_path: Path to the PDF file
+        parallel: Split large documents across worker processes (one page range each)
+        
+    Returns:
+        Iterator over page texts
+    """
+    yielded = 0
+    try:
+        with fitz.open(pdf_path) as doc:
+            num_pages = len(doc)
+            if not parallel or num_pages < PARALLEL_MIN_PAGES:
+                for page in doc:
+                    yield _valid_utf8(page.get_text("text"))
+                    yielded += 1
+                return
+        for page_text in _extract_pages_parallel(pdf_path, num_pages):
+            yield _valid_utf8(page_text)
+            yielded += 1
     except Exception as e:
-        raise Exception(f"Error extracting text from PDF: {str(e)}")
+        # Fall back only if nothing has been handed out yet; otherwise pages would repeat
+        if yielded:
+            raise Exception(f"Error extracting text from PDF: {str(e)}")
+        try:
+            pages = _extract_pages_with_pdfium(pdf_path)
+        except Exception:
+            raise Exception(f"Error extracting text from PDF: {str(e)}")
+        for page_text in pages:
+            yield _valid_utf8(page_text)
+
+
+def _valid_utf8(text: str) -> str:
+    """Drop characters that can't be encoded as UTF-8 (e.g. lone surrogates)"""
+    return text.encode('utf-8', errors='ignore').decode('utf-8')
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) (runs in a worker process)"""
+    with fitz.open(pdf_path) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+
+def _extract_pages_parallel(pdf_path: str, num_pages: int) -> List[str]:
+    """Extract per-page text with contiguous page ranges spread over CPU cores, in page order"""
+    workers = min(os.cpu_count() or 1, num_pages)
+    step = -(-num_pages // workers)  # ceil division
+    starts = list(range(0, num_pages, step))
+    stops = [min(start + step, num_pages) for start in starts]
+    
+    # spawn, not fork: the caller may have threads running (e.g. a model loading in the background)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(starts), mp_context=context) as executor:
+        ranges = executor.map(_extract_page_range, [pdf_path] * len(starts), starts, stops)
+        return [page_text for page_range in ranges for page_text in page_range]
+
+
+def _extract_pages_with_pdfium(pdf_path: str) -> List[str]:
+    """Extract per-page text with pypdfium2 (optional dependency)"""
+    import pypdfium2 as pdfium
+    
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return [pdf[i].get_textpage().get_text_range() for i in range(len(pdf))]
+    finally:
+        pdf.close()
+
+
+def file_sha256(path: str) -> str:
+    """
+    Hash a file's contents without reading it into memory at once.
+    
+    Args:
+        path: Path to the file
+        
+    Returns:
+        Hex SHA-256 digest
+    """
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+        return digest.hexdigest()
 
 
 def extract_text_from_uploaded_file(uploaded_file) -> str:
@@ -40,7 +131,24 @@ def extract_text_from_uploaded_file(uploaded_file) -> str:
     Returns:
         Extracted text as a string
     """
-    # Save uploaded file permanently
+    file_path = save_uploaded_bytes(uploaded_file.getbuffer(), uploaded_file.name)
+    
+    # Extract text from saved file
+    text = extract_text_from_pdf(file_path)
+    return text
+
+
+def save_uploaded_bytes(data, file_name: str) -> str:
+    """
+    Save an uploaded file's contents permanently in the upload directory.
+    
+    Args:
+        data: File contents (bytes or any buffer)
+        file_name: Original file name
+        
+    Returns:
+        Path the file was saved to
+    """
     import config
     upload_dir = config.UPLOAD_DIR
     
@@ -48,22 +156,20 @@ def extract_text_from_uploaded_file(uploaded_file) -> str:
         os.makedirs(upload_dir)
     
     # Save file with original name
-    file_path = os.path.join(upload_dir, uploaded_file.name)
+    file_path = os.path.join(upload_dir, file_name)
     
     # If file already exists, add timestamp to avoid overwriting
     if os.path.exists(file_path):
         import datetime
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        name, ext = os.path.splitext(uploaded_file.name)
+        name, ext = os.path.splitext(file_name)
         file_path = os.path.join(upload_dir, f"{name}_{timestamp}{ext}")
     
     # Save the file
     with open(file_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+        f.write(data)
     
-    # Extract text from saved file
-    text = extract_text_from_pdf(file_path)
-    return text
+    return file_path
 
 
 def clean_text(text: str) -> str:
@@ -88,6 +194,26 @@ def clean_text(text: str) -> str:
     return '\n\n'.join(cleaned_lines)
 
 
+def clean_pages(pages: Iterable[str]) -> Iterator[str]:
+    """
+    Clean page texts as they are produced, yielding the kept lines.
+    
+    Joining the yielded lines with blank lines gives the same result as
+    clean_text on the joined pages, without building the raw text first.
+    
+    Args:
+        pages: Iterable of raw page texts
+        
+    Returns:
+        Iterator over cleaned lines
+    """
+    for page_text in pages:
+        for line in page_text.split('\n'):
+            line = line.strip()
+            if line and len(line) > 3:  # Ignore very short lines
+                yield line
+
+
 def split_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
     """
     Split text into smaller chunks for processing.
@@ -100,10 +226,42 @@ def split_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) ->
     Returns:
         List of text chunks
     """
+    return [chunk for chunk, _, _ in iter_chunks_with_offsets(text, chunk_size, overlap)]
+
+
+def split_into_chunks_with_offsets(text: str, chunk_size: int = 1000,
+                                   overlap: int = 200) -> List[Tuple[str, int, int]]:
+    """
+    Split text into smaller chunks, keeping each chunk's position in the text.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum size of each chunk
+        overlap: Number of characters to overlap between chunks
+        
+    Returns:
+        List of (chunk, start_char, end_char) tuples, where text[start_char:end_char] == chunk
+    """
+    return list(iter_chunks_with_offsets(text, chunk_size, overlap))
+
+
+def iter_chunks_with_offsets(text: str, chunk_size: int = 1000,
+                             overlap: int = 200) -> Iterator[Tuple[str, int, int]]:
+    """
+    Lazily split text into chunks, yielding (chunk, start_char, end_char) tuples.
+    
+    Args:
+        text: Text to split
+        chunk_size: Maximum size of each chunk
+        overlap: Number of characters to overlap between chunks
+        
+    Returns:
+        Iterator over (chunk, start_char, end_char) tuples
+    """
     if len(text) <= chunk_size:
-        return [text]
+        yield text, 0, len(text)
+        return
     
-    chunks = []
     start = 0
     
     while start < len(text):
@@ -116,11 +274,10 @@ def split_into_chunks(text: str, chunk_size: int = 1000, overlap: int = 200) ->
             if paragraph_break > start:
                 end = paragraph_break + 2
         
-        chunk = text[start:end].strip()
+        raw_chunk = text[start:end]
+        chunk = raw_chunk.strip()
         if chunk:
-            chunks.append(chunk)
+            chunk_start = start + len(raw_chunk) - len(raw_chunk.lstrip())
+            yield chunk, chunk_start, chunk_start + len(chunk)
         
         start = end - overlap
-    
-    return chunks
-
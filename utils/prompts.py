@@ -1,4 +1,6 @@
 """Prompt templates for different agents"""
+from functools import lru_cache
+from typing import Tuple
 
 FLASHCARD_PROMPT = """You are a flashcard generator. Create {num_flashcards} short flashcards from the text.
 
@@ -23,6 +25,28 @@ Format (JSON array only):
 Return ONLY the JSON array starting with [ and ending with ]."""
 
 
+@lru_cache(maxsize=32)
+def _flashcard_prompt_parts(num_flashcards: int) -> Tuple[str, str]:
+    """FLASHCARD_PROMPT split around {text}, with num_flashcards already filled in"""
+    prefix, suffix = FLASHCARD_PROMPT.split("{text}")
+    return prefix.format(num_flashcards=num_flashcards), suffix.format(num_flashcards=num_flashcards)
+
+
+def build_flashcard_prompt(text: str, num_flashcards: int) -> str:
+    """
+    Build the flashcard prompt (same result as FLASHCARD_PROMPT.format)
+    
+    Args:
+        text: Study text to generate flashcards from
+        num_flashcards: Number of flashcards to ask for
+        
+    Returns:
+        Prompt string
+    """
+    prefix, suffix = _flashcard_prompt_parts(num_flashcards)
+    return f"{prefix}{text}{suffix}"
+
+
 QUIZ_PROMPT = """You are a quiz generator for students. Create multiple-choice questions from the study material.
 
 Study Material:
@@ -0,0 +1,54 @@
+"""Token counting utilities for keeping LLM prompts within a token budget"""
+from functools import lru_cache
+from typing import List
+
+# Rough characters-per-token ratio used when tiktoken is unavailable
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """
+    Get the shared tiktoken encoding.
+    
+    Returns:
+        tiktoken Encoding, or None if tiktoken cannot be loaded
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"⚠️ tiktoken unavailable ({e}), falling back to character-based budgets")
+        return None
+
+
+def pack(parts: List[str], budget: int = 3000, separator: str = "\n\n") -> str:
+    """
+    Join text parts in order until the token budget is used up.
+    
+    The part that crosses the budget is truncated at a token boundary.
+    
+    Args:
+        parts: Text parts (e.g. context segments), in priority order
+        budget: Maximum number of tokens in the result
+        separator: Separator placed between parts
+        
+    Returns:
+        Packed text
+    """
+    enc = get_encoding()
+    if enc is None:
+        return separator.join(parts)[:budget * CHARS_PER_TOKEN]
+    
+    separator_ids = enc.encode(separator)
+    ids = []
+    for part in parts:
+        remaining = budget - len(ids)
+        if remaining <= 0:
+            break
+        part_ids = enc.encode(part)
+        if ids:
+            part_ids = separator_ids + part_ids
+        ids.extend(part_ids[:remaining])
+    
+    return enc.decode(ids)